@@ -4,6 +4,8 @@ import { getSearchHistory } from '../services/api';
 const HistoryPanel = ({ userId }) => {
   const [history, setHistory] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     if (userId) {
@@ -16,6 +18,7 @@ const HistoryPanel = ({ userId }) => {
       setLoading(true);
       const response = await getSearchHistory(userId);
       setHistory(response.data);
+      setNextCursor(response.headers['x-next-cursor'] || null);
     } catch (error) {
       console.error('Error loading history:', error);
     } finally {
@@ -23,6 +26,19 @@ const HistoryPanel = ({ userId }) => {
     }
   };
 
+  const loadMore = async () => {
+    try {
+      setLoadingMore(true);
+      const response = await getSearchHistory(userId, nextCursor);
+      setHistory((previous) => [...previous, ...response.data]);
+      setNextCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Error loading more history:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   if (loading) {
     return <div style={styles.loading}>Loading history...</div>;
   }
@@ -49,6 +65,11 @@ const HistoryPanel = ({ userId }) => {
           </div>
         ))}
       </div>
+      {nextCursor && (
+        <button style={styles.loadMore} onClick={loadMore} disabled={loadingMore}>
+          {loadingMore ? 'Loading...' : 'Load more'}
+        </button>
+      )}
     </div>
   );
 };
@@ -88,6 +109,17 @@ const styles = {
     fontSize: '12px',
     color: '#666',
   },
+  loadMore: {
+    display: 'block',
+    width: '100%',
+    marginTop: '12px',
+    padding: '10px',
+    background: '#f0f0f0',
+    border: '1px solid #e0e0e0',
+    borderRadius: '8px',
+    color: '#333',
+    cursor: 'pointer',
+  },
   loading: {
     textAlign: 'center',
     padding: '40px',
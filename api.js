@@ -64,5 +64,8 @@ export const classifyImage = (imageId) =>
 export const searchImages = (query, topK = 5) =>
   api.get(`/api/search?q=${encodeURIComponent(query)}&top_k=${topK}`);
 
-export const getSearchHistory = (userId) =>
-  api.get(`/api/history/${userId}`);
+export const searchImagesBatch = (queries, topK = 5) =>
+  api.post('/api/search/batch', { queries, top_k: topK });
+
+export const getSearchHistory = (userId, cursor) =>
+  api.get(`/api/history/${userId}`, { params: cursor ? { cursor } : {} });
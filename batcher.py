@@ -0,0 +1,113 @@
+from concurrent.futures import Future
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class MicroBatcher:
+    """
+    Groups concurrent single-item calls into batched calls of `fn`.
+
+    Callers `submit()` one item and get a Future; a worker thread collects
+    items until `max_batch_size` are queued or the oldest has waited
+    `max_wait_ms`, then runs `fn(items)` once and resolves every Future
+    with its own entry of the returned list. Larger batches raise
+    throughput, a shorter wait lowers latency under light load.
+    """
+
+    def __init__(self, fn, max_batch_size: int = 16, max_wait_ms: float = 5.0, name: str = "batcher"):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, got {max_batch_size}")
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes = {}  # batch size -> number of batches run with that size
+        self.busy_seconds = 0.0
+        self._thread = None
+
+    def submit(self, item) -> Future:
+        """Queue one item; the Future resolves to fn's result for it"""
+        future = Future()
+        with self.lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        self.queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        """Submit one item and wait for its result"""
+        return self.submit(item).result()
+
+    def _collect(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                self.queue.put(_STOP)  # Finish this batch, stop on the next loop
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if first is _STOP:
+                return
+            # Callers that cancelled while queued are dropped from the batch
+            batch = [(item, future) for item, future in self._collect(first) if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            try:
+                results = self.fn([item for item, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Error running {self.name} batch of {len(batch)}: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+            with self.lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+                self.busy_seconds += time.perf_counter() - started
+
+    def stats(self) -> dict:
+        """Counters since startup"""
+        with self.lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "busy_seconds": round(self.busy_seconds, 3),
+                "queued": self.queue.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+    def close(self):
+        """Run what is already queued, then stop the worker thread"""
+        with self.lock:
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self.queue.put(_STOP)
+            thread.join()
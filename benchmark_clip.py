@@ -0,0 +1,72 @@
+"""
+Benchmark CLIP inference backends on this machine.
+
+    python benchmark_clip.py --backends torch int8 onnx --threads 4
+
+Reports images/sec and texts/sec per backend, plus the lowest cosine
+similarity to the fp32 eager model on the benchmark inputs.
+"""
+import argparse
+import logging
+import sys
+import time
+
+import numpy as np
+import torch
+
+from ml.clip_model import CLIPModel, BACKENDS, NUM_THREADS
+
+TEXTS = [
+    "a photo of a dog", "a cat sleeping on a sofa", "a person riding a bicycle",
+    "a red car parked on the street", "sunset over the sea", "a plate of food",
+    "a city skyline at night", "a group of people at a party",
+]
+
+def timed(fn, inputs: list, batch_size: int, rounds: int):
+    """Run fn over inputs in batches; return (items/sec, concatenated outputs of the last round)"""
+    fn(inputs[:batch_size])  # Warm up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        outputs = [fn(inputs[i:i + batch_size]) for i in range(0, len(inputs), batch_size)]
+    elapsed = time.perf_counter() - start
+    return rounds * len(inputs) / elapsed, np.concatenate(outputs)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark CLIP inference backends")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--threads", type=int, default=NUM_THREADS, help="Intra-op threads, 0 = library default")
+    parser.add_argument("--images", type=int, default=64, help="Synthetic images per round")
+    parser.add_argument("--texts", type=int, default=256, help="Texts per round")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    generator = torch.Generator().manual_seed(0)
+    images = list(torch.randn(args.images, 3, 224, 224, generator=generator))
+    texts = [f"{TEXTS[i % len(TEXTS)]} #{i}" for i in range(args.texts)]
+
+    reference = None
+    print(f"{'backend':<8} {'images/sec':>11} {'texts/sec':>10} {'min cosine':>11}")
+    for backend in args.backends:
+        model = CLIPModel(backend=backend, num_threads=args.threads)
+        try:
+            if model.backend != backend:
+                print(f"{backend:<8} unavailable, fell back to {model.backend}", file=sys.stderr)
+                continue
+            image_rate, image_vectors = timed(model.encode_images, images, args.batch_size, args.rounds)
+            text_rate, text_vectors = timed(model.encode_texts, texts, args.batch_size, args.rounds)
+        finally:
+            model.close()
+
+        if reference is None and backend == "torch":
+            reference = (image_vectors, text_vectors)
+        similarity = "-"
+        if reference is not None:
+            similarity = f"{min((image_vectors * reference[0]).sum(axis=1).min(), (text_vectors * reference[1]).sum(axis=1).min()):.4f}"
+        print(f"{backend:<8} {image_rate:>11.1f} {text_rate:>10.1f} {similarity:>11}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
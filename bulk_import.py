@@ -0,0 +1,52 @@
+"""
+Bulk import images for an existing user, without going through HTTP.
+
+    python bulk_import.py --username alice photos/ holiday.zip scans.tar.gz
+
+Directories are walked recursively; zip and tar archives are streamed.
+"""
+import argparse
+import logging
+import sys
+
+from database import SessionLocal, Base, engine, migrate_schema
+from models import User
+from services.bulk_ingest import BulkIngestor, BULK_BATCH_SIZE, iter_paths
+
+def print_progress(total: int, uploaded: int, failed: int):
+    print(f"\r{uploaded}/{total} imported, {failed} failed", end="", file=sys.stderr, flush=True)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk import images into VisionQuery")
+    parser.add_argument("paths", nargs="+", help="Image files, directories or zip/tar archives")
+    parser.add_argument("--username", required=True, help="Owner of the imported images")
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE, help="Images per CLIP batch and commit")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    Base.metadata.create_all(bind=engine)
+    migrate_schema()
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == args.username).first()
+        if not user:
+            parser.error(f"Unknown user: {args.username}")
+
+        ingestor = BulkIngestor(user.id, db, batch_size=args.batch_size, progress=print_progress)
+        result = ingestor.ingest(iter_paths(args.paths))
+        print(file=sys.stderr)
+        for failure in result["failed"]:
+            print(f"FAILED {failure['filename']}: {failure['error']}", file=sys.stderr)
+        print(f"Imported {result['uploaded']} of {result['total']} images")
+    finally:
+        db.close()
+        # Checkpoint so the server starts without replaying the import's WAL
+        from ml import faiss_index
+        if faiss_index.faiss_index is not None:
+            faiss_index.faiss_index.close()
+
+    return 1 if result["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from sqlalchemy.orm import Session
+import io
+import os
+import tarfile
+import zipfile
+import numpy as np
+import logging
+
+from models import Image
+from services.image_service import hash_content, save_uploaded_file
+from services.ingestion import STATUS_PROCESSING, STATUS_INDEXED, INGEST_CLASSIFY, get_ingest_classifier
+from ml.preprocess import get_preprocessor
+
+logger = logging.getLogger(__name__)
+
+# Files embedded per CLIP forward pass, DB commit and index write
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "64"))
+# Threads hashing and writing files; decoding runs on the shared preprocessing pool
+BULK_IO_WORKERS = int(os.getenv("BULK_IO_WORKERS", str(os.cpu_count() or 4)))
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp", ".tif", ".tiff"}
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+def is_image_name(filename: str) -> bool:
+    return os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS
+
+def is_archive_name(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+def iter_archive(fileobj, name: str = ""):
+    """Yield (filename, bytes) for every image in a zip or tar archive, one member at a time"""
+    if name.lower().endswith(".zip") or zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for member in archive.infolist():
+                if not member.is_dir() and is_image_name(member.filename):
+                    yield os.path.basename(member.filename), archive.read(member)
+        return
+
+    fileobj.seek(0)
+    # Stream mode reads tar members sequentially without seeking back
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        for member in archive:
+            if member.isfile() and is_image_name(member.name):
+                yield os.path.basename(member.name), archive.extractfile(member).read()
+
+def iter_paths(paths: list[str]):
+    """Yield (filename, bytes) for image files, directories (recursively) and archives"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    yield from iter_paths([os.path.join(root, filename)])
+        elif is_archive_name(path):
+            with open(path, "rb") as f:
+                yield from iter_archive(f, path)
+        elif is_image_name(path):
+            with open(path, "rb") as f:
+                yield os.path.basename(path), f.read()
+
+class BulkIngestor:
+    """
+    Ingests a stream of (filename, bytes) for one user in batches of
+    BULK_BATCH_SIZE: files are hashed and written by a thread pool, decoded
+    once into both CLIP and classifier inputs while the previous batch is
+    running inference, embedded and classified with one forward pass each,
+    inserted with one DB commit and appended to the FAISS index with one WAL
+    write per batch.
+
+    Rows are inserted as processing, claimed by this ingestor, and marked
+    indexed once their vectors are in the index, so a batch interrupted in
+    between is finished by the ingestion pipeline once the claim goes stale.
+    """
+
+    def __init__(self, user_id: int, db: Session, batch_size: int = BULK_BATCH_SIZE, progress=None):
+        from ml.clip_model import get_clip_model
+        from ml.embedding_store import get_embedding_store
+        from ml.faiss_index import get_faiss_index
+        self.user_id = user_id
+        self.db = db
+        self.batch_size = batch_size
+        self.progress = progress  # Called with (total, uploaded, failed) after every batch
+        self.clip_model = get_clip_model()
+        self.faiss_index = get_faiss_index()
+        self.embedding_store = get_embedding_store()
+        self.classifier = get_ingest_classifier() if INGEST_CLASSIFY else None
+        self.preprocessor = get_preprocessor()
+        self.executor = ThreadPoolExecutor(max_workers=BULK_IO_WORKERS, thread_name_prefix="bulk-ingest")
+        self.total = 0
+        self.image_ids = []
+        self.failures = []  # (filename, error)
+
+    def ingest(self, files) -> dict:
+        """Consume an iterable of (filename, bytes) and return stats()"""
+        try:
+            # Batch N+1 decodes on the preprocessing pool while batch N runs inference
+            prepared = None
+            for batch in _batches(files, self.batch_size):
+                upcoming = self._prepare(batch)
+                if prepared is not None:
+                    self._finish(prepared)
+                prepared = upcoming
+            if prepared is not None:
+                self._finish(prepared)
+        finally:
+            self.executor.shutdown(wait=True)
+        return self.stats()
+
+    def reject(self, filename: str, error: str):
+        """Count a file that was refused before ingestion"""
+        self.total += 1
+        self.failures.append((filename, error))
+
+    def stats(self) -> dict:
+        return {
+            "total": self.total,
+            "uploaded": len(self.image_ids),
+            "image_ids": self.image_ids,
+            "failed": [{"filename": filename, "error": error} for filename, error in self.failures],
+        }
+
+    def _prepare(self, batch: list) -> dict:
+        """Hash a batch, look up known content and start decoding the rest"""
+        self.total += len(batch)
+        hashes = list(self.executor.map(lambda item: hash_content(item[1]), batch))
+
+        # Known bytes reuse the stored file, classification and embedding. Plain
+        # tuples, since the previous batch's commit would expire ORM rows
+        known = {}
+        rows = self.db.query(Image.content_hash, Image.id, Image.filepath, Image.classification, Image.confidence)
+        for content_hash, *image in rows.filter(Image.content_hash.in_(set(hashes))):
+            known.setdefault(content_hash, image)
+        embeddings = {}
+        for content_hash, (image_id, _, _, _) in known.items():
+            embedding = self.faiss_index.get_vector(image_id)
+            if embedding is not None:
+                embeddings[content_hash] = embedding
+
+        # Decode each new content once, producing both model inputs from one buffer
+        transforms = {"clip": self.clip_model.preprocess}
+        if self.classifier is not None and not self.classifier.from_embedding:
+            transforms["classifier"] = self.classifier.to_input
+        decoding = {}
+        for (_, data), content_hash in zip(batch, hashes):
+            if content_hash not in embeddings and content_hash not in decoding:
+                decoding[content_hash] = self.preprocessor.submit(io.BytesIO(data), transforms)
+        return {"batch": batch, "hashes": hashes, "known": known, "embeddings": embeddings, "decoding": decoding}
+
+    def _finish(self, prepared: dict):
+        """Embed, store and index a prepared batch"""
+        batch, hashes, known = prepared["batch"], prepared["hashes"], prepared["known"]
+        embeddings = prepared["embeddings"]
+        inputs, errors = {}, {}
+        for content_hash, future in prepared["decoding"].items():
+            try:
+                inputs[content_hash] = future.result()
+            except Exception as e:
+                errors[content_hash] = f"Could not decode image: {e}"
+        if inputs:
+            vectors = self.clip_model.encode_images([item["clip"] for item in inputs.values()])
+            embeddings.update(zip(inputs, vectors))
+        classifications = self._classify(inputs, embeddings)
+
+        accepted = []
+        for (filename, data), content_hash in zip(batch, hashes):
+            if content_hash in embeddings:
+                accepted.append((filename, data, content_hash))
+            else:
+                self.failures.append((filename, errors.get(content_hash, "Could not embed image")))
+
+        # Write each new content once, in parallel
+        new_files = {}
+        for filename, data, content_hash in accepted:
+            if content_hash not in known:
+                new_files.setdefault(content_hash, (data, filename, content_hash))
+        saved = dict(zip(new_files, self.executor.map(lambda args: save_uploaded_file(*args), new_files.values())))
+        filepaths = [known[content_hash][1] if content_hash in known else saved[content_hash]
+                     for _, _, content_hash in accepted]
+        for content_hash, (_, _, classification, confidence) in known.items():
+            if classification is not None:
+                classifications[content_hash] = (classification, confidence)
+        claimed_at = datetime.now(timezone.utc)
+        rows = [
+            Image(
+                filename=filename,
+                filepath=filepath,
+                user_id=self.user_id,
+                content_hash=content_hash,
+                classification=classifications.get(content_hash, (None, None))[0],
+                confidence=classifications.get(content_hash, (None, None))[1],
+                status=STATUS_PROCESSING,
+                claimed_at=claimed_at
+            )
+            for (filename, _, content_hash), filepath in zip(accepted, filepaths)
+        ]
+        if rows:
+            self.db.add_all(rows)
+            self.db.flush()
+            # Read ids before commit expires the rows
+            image_ids = [row.id for row in rows]
+            vectors = np.stack([embeddings[content_hash] for _, _, content_hash in accepted])
+            for row, locator in zip(rows, self.embedding_store.append(image_ids, vectors)):
+                row.embedding_path = locator
+            self.db.commit()
+            self.faiss_index.add_vectors(vectors, image_ids, self.user_id)
+            self.db.query(Image).filter(Image.id.in_(image_ids)).update(
+                {"status": STATUS_INDEXED}, synchronize_session=False
+            )
+            self.db.commit()
+            self.image_ids.extend(image_ids)
+
+        logger.info(f"Bulk ingested {len(self.image_ids)}/{self.total} files, {len(self.failures)} failed")
+        if self.progress is not None:
+            self.progress(self.total, len(self.image_ids), len(self.failures))
+
+    def _classify(self, inputs: dict, embeddings: dict) -> dict:
+        """content_hash -> (classification, confidence) for newly decoded content, in one pass"""
+        if self.classifier is None or not inputs:
+            return {}
+        try:
+            if self.classifier.from_embedding:
+                results = self.classifier.classify_embeddings(np.stack([embeddings[content_hash] for content_hash in inputs]))
+            else:
+                results = self.classifier.classify_inputs([item["classifier"] for item in inputs.values()])
+            return dict(zip(inputs, results))
+        except Exception as e:
+            # Still searchable; /api/classify retries on demand
+            logger.warning(f"Could not classify bulk batch: {e}")
+            return {}
+
+def _batches(items, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
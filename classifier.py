@@ -1,19 +1,45 @@
 import numpy as np
-import tensorflow as tf
-from tensorflow import keras
 from PIL import Image
 import os
+import threading
 import logging
 
+from ml.preprocess import load_image, get_preprocessor
+
 logger = logging.getLogger(__name__)
 
+# "clip" classifies from the CLIP embedding every image already has,
+# "mobilenet" runs the separate MobileNetV2 model (requires TensorFlow)
+CLASSIFIER_BACKEND = os.getenv("CLASSIFIER_BACKEND", "clip")
+# Images per forward pass in classify_batch
+CLASSIFY_BATCH_SIZE = int(os.getenv("CLASSIFY_BATCH_SIZE", "32"))
+# Optional trained linear head for the clip backend: .npz with weights (2, 512) and bias (2,)
+CLIP_HEAD_PATH = os.getenv("CLIP_HEAD_PATH", "ml/clip_head.npz")
+
+# Binary classification: [Animal, Person]
+CLASSES = ["Animal", "Person"]
+
+# TensorFlow is imported when the mobilenet backend loads, not at import time
+keras = None
+
+# Zero-shot prompts per class; their mean text embedding is the class direction
+PROMPTS = {
+    "Animal": ["a photo of an animal", "a photo of a pet", "a photo of a wild animal", "a close-up photo of an animal"],
+    "Person": ["a photo of a person", "a photo of people", "a portrait of a person", "a selfie of a person"],
+}
+# CLIP's learned logit scale, so softmax confidences match its own zero-shot probabilities
+CLIP_LOGIT_SCALE = 100.0
+
 class ImageClassifier:
+    from_embedding = False
+    
     def __init__(self):
         self.model = None
         self.load_model()
     
     def load_model(self):
         """Load MobileNetV2 pre-trained model and add classification head"""
+        _import_keras()
         try:
             base_model = keras.applications.MobileNetV2(
                 input_shape=(224, 224, 3),
@@ -53,41 +79,174 @@ class ImageClassifier:
     def preprocess_image(self, image_path: str) -> np.ndarray:
         """Preprocess image for MobileNetV2"""
         try:
-            img = Image.open(image_path).convert('RGB')
-            img = img.resize((224, 224))
-            img_array = np.array(img)
-            img_array = np.expand_dims(img_array, axis=0)
-            img_array = keras.applications.mobilenet_v2.preprocess_input(img_array)
-            return img_array
+            return self.to_input(load_image(image_path))
         except Exception as e:
             logger.error(f"Error preprocessing image: {e}")
             raise
     
-    def classify(self, image_path: str) -> tuple[str, float]:
+    def to_input(self, img: Image.Image) -> np.ndarray:
+        """MobileNetV2 input batch of one from a decoded RGB image"""
+        img = img.resize((224, 224))
+        img_array = np.array(img)
+        img_array = np.expand_dims(img_array, axis=0)
+        img_array = keras.applications.mobilenet_v2.preprocess_input(img_array)
+        return img_array
+    
+    def classify(self, image_path: str, image_id: int = None) -> tuple[str, float]:
         """
         Classify image as Animal or Person
         Returns: (classification, confidence)
         """
         try:
             processed_img = self.preprocess_image(image_path)
-            predictions = self.model.predict(processed_img, verbose=0)
-            
-            # Binary classification: [Animal, Person]
-            classes = ["Animal", "Person"]
-            predicted_class_idx = np.argmax(predictions[0])
-            confidence = float(predictions[0][predicted_class_idx])
-            classification = classes[predicted_class_idx]
-            
-            return classification, confidence
+        except Exception as e:
+            raise Exception(f"Classification failed: {str(e)}")
+        return self.classify_inputs([processed_img])[0]
+    
+    def classify_inputs(self, inputs: list[np.ndarray]) -> list[tuple[str, float]]:
+        """Classify preprocessed inputs (see to_input) with one forward pass"""
+        try:
+            # Calling the model directly skips predict()'s per-call dataset setup
+            predictions = self.model(np.concatenate(inputs), training=False).numpy()
+            return [_decode(prediction) for prediction in predictions]
         except Exception as e:
             logger.error(f"Error classifying image: {e}")
             raise Exception(f"Classification failed: {str(e)}")
+    
+    def classify_batch(self, image_paths: list[str], image_ids: list[int] = None) -> list:
+        """
+        Classify many images: decoding runs on the shared preprocessing pool,
+        ahead of inference, and each chunk of CLASSIFY_BATCH_SIZE images takes
+        a single forward pass.
+        Returns: (classification, confidence) per path, or None where the image could not be read
+        """
+        preprocessor = get_preprocessor()
+        futures = [preprocessor.submit(path, {"classifier": self.to_input}) for path in image_paths]
+        results = [None] * len(image_paths)
+        for start in range(0, len(image_paths), CLASSIFY_BATCH_SIZE):
+            inputs = {}
+            for i in range(start, min(start + CLASSIFY_BATCH_SIZE, len(image_paths))):
+                try:
+                    inputs[i] = futures[i].result()["classifier"]
+                except Exception as e:
+                    logger.warning(f"Could not read image {image_paths[i]}: {e}")
+            if inputs:
+                for i, result in zip(inputs, self.classify_inputs(list(inputs.values()))):
+                    results[i] = result
+        return results
+
+class ZeroShotClassifier:
+    """
+    Classifies from the CLIP image embedding: a dot product against cached
+    text-prompt embeddings (zero-shot), or against a trained linear head
+    when CLIP_HEAD_PATH exists. Indexed images are classified straight from
+    the vector stored in FAISS, so no second CNN is loaded or run.
+    """
+    from_embedding = True
+    
+    def __init__(self):
+        from ml.clip_model import get_clip_model
+        self.clip_model = get_clip_model()
+        self.weights = None
+        self.bias = None
+        self.load_model()
+    
+    def load_model(self):
+        """Load the linear head, or build one from the class prompts"""
+        try:
+            if os.path.exists(CLIP_HEAD_PATH):
+                head = np.load(CLIP_HEAD_PATH)
+                self.weights = head["weights"].astype('float32')
+                self.bias = head["bias"].astype('float32')
+                logger.info("Loaded CLIP classification head from file")
+            else:
+                directions = []
+                for name in CLASSES:
+                    direction = np.mean([self.clip_model.encode_text(prompt) for prompt in PROMPTS[name]], axis=0)
+                    directions.append(direction / np.linalg.norm(direction))
+                self.weights = CLIP_LOGIT_SCALE * np.stack(directions).astype('float32')
+                self.bias = np.zeros(len(CLASSES), dtype='float32')
+                logger.info("Built zero-shot CLIP classifier from text prompts")
+        except Exception as e:
+            logger.error(f"Error loading classifier: {e}")
+            raise
+    
+    def classify_embeddings(self, embeddings: np.ndarray) -> list[tuple[str, float]]:
+        """Classify (n, 512) normalized CLIP image embeddings"""
+        logits = embeddings @ self.weights.T + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        return [_decode(prediction) for prediction in probabilities]
+    
+    def classify(self, image_path: str, image_id: int = None) -> tuple[str, float]:
+        """
+        Classify image as Animal or Person
+        Returns: (classification, confidence)
+        """
+        result = self.classify_batch([image_path], [image_id])[0]
+        if result is None:
+            raise Exception(f"Classification failed: could not embed {image_path}")
+        return result
+    
+    def classify_batch(self, image_paths: list[str], image_ids: list[int] = None) -> list:
+        """
+        Classify many images. Indexed ones reuse their stored vectors, looked
+        up together; the rest are decoded on the shared preprocessing pool and
+        embedded CLASSIFY_BATCH_SIZE at a time with one CLIP forward pass each.
+        Returns: (classification, confidence) per path, or None where the image could not be read
+        """
+        from ml.faiss_index import get_faiss_index
+        image_ids = image_ids or [None] * len(image_paths)
+        stored = get_faiss_index().get_vectors([image_id for image_id in image_ids if image_id is not None])
+        embeddings = {i: stored[image_id] for i, image_id in enumerate(image_ids) if image_id in stored}
+        
+        missing = [i for i in range(len(image_paths)) if i not in embeddings]
+        preprocessor = get_preprocessor()
+        futures = {i: preprocessor.submit(image_paths[i], {"clip": self.clip_model.preprocess}) for i in missing}
+        for start in range(0, len(missing), CLASSIFY_BATCH_SIZE):
+            inputs = {}
+            for i in missing[start:start + CLASSIFY_BATCH_SIZE]:
+                try:
+                    inputs[i] = futures[i].result()["clip"]
+                except Exception as e:
+                    logger.warning(f"Could not read image {image_paths[i]}: {e}")
+            if inputs:
+                embeddings.update(zip(inputs, self.clip_model.encode_images(list(inputs.values()))))
+        
+        results = [None] * len(image_paths)
+        if embeddings:
+            for i, result in zip(embeddings, self.classify_embeddings(np.stack(list(embeddings.values())))):
+                results[i] = result
+        return results
+
+def _import_keras():
+    global keras
+    if keras is None:
+        try:
+            from tensorflow import keras as tf_keras
+        except ImportError:
+            raise RuntimeError("CLASSIFIER_BACKEND=mobilenet requires TensorFlow to be installed")
+        keras = tf_keras
+    return keras
+
+def _decode(prediction: np.ndarray) -> tuple[str, float]:
+    predicted_class_idx = int(np.argmax(prediction))
+    return CLASSES[predicted_class_idx], float(prediction[predicted_class_idx])
 
 # Global classifier instance
 classifier = None
+classifier_lock = threading.Lock()
 
 def get_classifier():
     global classifier
     if classifier is None:
-        classifier = ImageClassifier()
+        with classifier_lock:
+            if classifier is None:
+                if CLASSIFIER_BACKEND == "mobilenet":
+                    classifier = ImageClassifier()
+                elif CLASSIFIER_BACKEND == "clip":
+                    classifier = ZeroShotClassifier()
+                else:
+                    raise ValueError(f"Unknown classifier backend: {CLASSIFIER_BACKEND}")
     return classifier
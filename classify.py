@@ -3,19 +3,29 @@ from sqlalchemy.orm import Session
 import logging
 
 from database import get_db
-from models import User, Image
-from schemas import ClassificationResponse
-from auth.jwt import get_current_user
+from models import Image
+from schemas import ClassificationResponse, ClassificationBatchRequest, ClassificationBatchResponse
+from auth.jwt import get_current_user_id
 from ml.classifier import get_classifier
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api", tags=["classify"])
 
+def store_classification(image: Image, classification: str, confidence: float, db: Session):
+    """Set an image's classification and share it with unclassified uploads of the same bytes"""
+    image.classification = classification
+    image.confidence = confidence
+    if image.content_hash:
+        db.query(Image).filter(
+            Image.content_hash == image.content_hash,
+            Image.classification.is_(None)
+        ).update({"classification": classification, "confidence": confidence}, synchronize_session=False)
+
 @router.get("/classify", response_model=ClassificationResponse)
 def classify_image(
     image_id: int = Query(..., description="Image ID to classify"),
-    current_user: User = Depends(get_current_user),
+    current_user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """Classify an image as Animal or Person"""
@@ -23,7 +33,7 @@ def classify_image(
         # Get image
         image = db.query(Image).filter(
             Image.id == image_id,
-            Image.user_id == current_user.id
+            Image.user_id == current_user_id
         ).first()
         
         if not image:
@@ -35,11 +45,10 @@ def classify_image(
         # Classify if not already classified
         if image.classification is None:
             classifier = get_classifier()
-            classification, confidence = classifier.classify(image.filepath)
+            classification, confidence = classifier.classify(image.filepath, image.id)
             
-            # Update database
-            image.classification = classification
-            image.confidence = confidence
+            # Update database, including other uploads of the same bytes
+            store_classification(image, classification, confidence, db)
             db.commit()
             db.refresh(image)
         else:
@@ -59,3 +68,62 @@ def classify_image(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error classifying image: {str(e)}"
         )
+
+@router.post("/classify/batch", response_model=ClassificationBatchResponse)
+def classify_images(
+    request: ClassificationBatchRequest,
+    current_user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """Classify many images at once; already classified images are served from the database"""
+    try:
+        image_ids = list(dict.fromkeys(request.image_ids))
+        images = {
+            image.id: image
+            for image in db.query(Image).filter(
+                Image.id.in_(image_ids),
+                Image.user_id == current_user_id
+            )
+        }
+        
+        # One batched classifier call for everything not classified yet
+        unclassified = [image for image in images.values() if image.classification is None]
+        failed = []
+        if unclassified:
+            classifier = get_classifier()
+            predictions = classifier.classify_batch(
+                [image.filepath for image in unclassified],
+                [image.id for image in unclassified]
+            )
+            for image, prediction in zip(unclassified, predictions):
+                if prediction is None:
+                    failed.append(image.id)
+                else:
+                    store_classification(image, *prediction, db)
+        
+        # Built before commit, which would expire every row
+        results = [
+            ClassificationResponse(
+                image_id=image_id,
+                classification=images[image_id].classification,
+                confidence=images[image_id].confidence
+            )
+            for image_id in image_ids
+            if image_id in images and image_id not in failed
+        ]
+        if unclassified:
+            db.commit()
+        
+        return ClassificationBatchResponse(
+            results=results,
+            not_found=[image_id for image_id in image_ids if image_id not in images],
+            failed=failed
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error classifying images: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error classifying images: {str(e)}"
+        )
@@ -1,63 +1,250 @@
 import torch
 import clip
-from PIL import Image
 import numpy as np
 import os
+import threading
 import logging
 
+from ml.batcher import MicroBatcher
+from ml.embedding_cache import EmbeddingCache
+from ml.preprocess import load_image
+
 logger = logging.getLogger(__name__)
 
+# Concurrent encode calls are grouped into one forward pass of up to this many
+# items, waiting at most CLIP_MAX_WAIT_MS for the batch to fill
+MAX_BATCH_SIZE = int(os.getenv("CLIP_MAX_BATCH_SIZE", "16"))
+MAX_WAIT_MS = float(os.getenv("CLIP_MAX_WAIT_MS", "5"))
+
+MODEL_NAME = "ViT-B/32"
+
+# "torch" runs the fp32 eager model, "int8" a torch.ao dynamically quantized
+# copy, "onnx" an exported graph on onnxruntime (int8 and onnx are CPU only)
+BACKEND = os.getenv("CLIP_BACKEND", "torch")
+# Intra-op threads for torch / onnxruntime, 0 = library default
+NUM_THREADS = int(os.getenv("CLIP_NUM_THREADS", "0"))
+ONNX_DIR = os.getenv("CLIP_ONNX_DIR", "ml/clip_onnx")
+# Alternate backends must match the eager model at least this closely (cosine), or fall back to torch
+MIN_COSINE = float(os.getenv("CLIP_BACKEND_MIN_COSINE", "0.99"))
+BACKENDS = ("torch", "int8", "onnx")
+
 class CLIPModel:
-    def __init__(self):
+    def __init__(self, backend: str = BACKEND, num_threads: int = NUM_THREADS):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown CLIP backend: {backend}")
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.backend = backend
+        self.num_threads = num_threads
         self.model = None
         self.preprocess = None
+        self.image_session = None  # onnxruntime sessions for the onnx backend
+        self.text_session = None
         self.load_model()
-    
+        self.image_batcher = MicroBatcher(self._encode_image_batch, MAX_BATCH_SIZE, MAX_WAIT_MS, "clip-image")
+        self.text_batcher = MicroBatcher(self._encode_text_batch, MAX_BATCH_SIZE, MAX_WAIT_MS, "clip-text")
+        # Backends differ slightly numerically, so each keeps its own cache entries
+        self.text_cache = EmbeddingCache(f"{MODEL_NAME}:{self.backend}")
+
     def load_model(self):
         """Load CLIP model"""
         try:
-            self.model, self.preprocess = clip.load("ViT-B/32", device=self.device)
+            if self.num_threads:
+                torch.set_num_threads(self.num_threads)
+            self.model, self.preprocess = clip.load(MODEL_NAME, device=self.device)
             self.model.eval()
-            logger.info(f"CLIP model loaded on device: {self.device}")
+            if self.backend != "torch":
+                if self.device != "cpu":
+                    logger.warning(f"CLIP backend {self.backend} is CPU only, using torch on {self.device}")
+                    self.backend = "torch"
+                else:
+                    self._load_backend()
+            logger.info(f"CLIP model loaded on device: {self.device} (backend={self.backend})")
         except Exception as e:
             logger.error(f"Error loading CLIP model: {e}")
             raise
-    
+
+    def _load_backend(self):
+        """Swap in the configured backend once it reproduces the eager model's outputs"""
+        eager = self.model
+        try:
+            if self.backend == "int8":
+                self.model = torch.ao.quantization.quantize_dynamic(eager, {torch.nn.Linear}, dtype=torch.qint8)
+            else:
+                self._load_onnx(eager)
+            similarity = self.compare(eager)
+        except Exception as e:
+            logger.error(f"Could not load CLIP backend {self.backend}, using torch: {e}")
+            self._use_eager(eager)
+            return
+
+        if similarity < MIN_COSINE:
+            logger.error(
+                f"CLIP backend {self.backend} diverges from the eager model "
+                f"(min cosine {similarity:.4f} < {MIN_COSINE}), using torch"
+            )
+            self._use_eager(eager)
+            return
+        logger.info(f"CLIP backend {self.backend} matches the eager model (min cosine {similarity:.4f})")
+        if self.backend == "onnx":
+            self.model = None  # Sessions hold their own copy of the weights
+
+    def _use_eager(self, eager):
+        self.backend, self.model = "torch", eager
+        self.image_session = self.text_session = None
+
+    def _load_onnx(self, eager):
+        import onnxruntime
+
+        os.makedirs(ONNX_DIR, exist_ok=True)
+        prefix = os.path.join(ONNX_DIR, MODEL_NAME.replace("/", "-"))
+        image_path, text_path = f"{prefix}-image.onnx", f"{prefix}-text.onnx"
+        if not os.path.exists(image_path):
+            _export_onnx(_ImageEncoder(eager), torch.zeros(1, 3, 224, 224), "pixels", image_path)
+        if not os.path.exists(text_path):
+            _export_onnx(_TextEncoder(eager), clip.tokenize(["a photo"]), "tokens", text_path)
+
+        options = onnxruntime.SessionOptions()
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        providers = ["CPUExecutionProvider"]
+        self.image_session = onnxruntime.InferenceSession(image_path, options, providers=providers)
+        self.text_session = onnxruntime.InferenceSession(text_path, options, providers=providers)
+
+    def compare(self, eager) -> float:
+        """Lowest cosine similarity between this backend's and `eager`'s embeddings on probe inputs"""
+        generator = torch.Generator().manual_seed(0)
+        pixels = torch.randn(4, 3, 224, 224, generator=generator)
+        tokens = clip.tokenize(["a photo of a dog", "a person riding a bicycle", "a red car", "sunset over the sea"])
+        with torch.no_grad():
+            expected_images = _normalize(eager.encode_image(pixels).float().numpy())
+            expected_texts = _normalize(eager.encode_text(tokens).float().numpy())
+        images = _normalize(self._image_features(pixels))
+        texts = _normalize(self._text_features(tokens))
+        return float(min((images * expected_images).sum(axis=1).min(), (texts * expected_texts).sum(axis=1).min()))
+
     def encode_image(self, image_path: str) -> np.ndarray:
         """Encode image to embedding vector"""
         try:
-            image = Image.open(image_path).convert('RGB')
-            image_tensor = self.preprocess(image).unsqueeze(0).to(self.device)
-            
-            with torch.no_grad():
-                image_features = self.model.encode_image(image_tensor)
-                image_features = image_features / image_features.norm(dim=-1, keepdim=True)
-            
-            return image_features.cpu().numpy().flatten().astype('float32')
+            # Decode and preprocess in the calling thread; only the forward pass is batched
+            return self.encode_image_input(self.preprocess(load_image(image_path)))
         except Exception as e:
             logger.error(f"Error encoding image: {e}")
             raise
-    
+
+    def encode_image_input(self, image_tensor) -> np.ndarray:
+        """Encode one preprocessed image (see `preprocess`) through the micro-batcher"""
+        return self.image_batcher(image_tensor)
+
     def encode_text(self, text: str) -> np.ndarray:
-        """Encode text to embedding vector"""
+        """Encode text to embedding vector; repeated queries skip the model"""
         try:
-            text_tokens = clip.tokenize([text]).to(self.device)
-            
-            with torch.no_grad():
-                text_features = self.model.encode_text(text_tokens)
-                text_features = text_features / text_features.norm(dim=-1, keepdim=True)
-            
-            return text_features.cpu().numpy().flatten().astype('float32')
+            embedding = self.text_cache.get(text)
+            if embedding is None:
+                embedding = self.text_batcher(clip.tokenize([text])[0])
+                self.text_cache.put(text, embedding)
+            return embedding
         except Exception as e:
             logger.error(f"Error encoding text: {e}")
             raise
 
+    def encode_images(self, image_tensors: list) -> np.ndarray:
+        """Encode already batched, preprocessed images directly, bypassing the micro-batcher"""
+        try:
+            return self._encode_image_batch(image_tensors)
+        except Exception as e:
+            logger.error(f"Error encoding images: {e}")
+            raise
+
+    def encode_texts(self, texts: list[str], use_cache: bool = False) -> np.ndarray:
+        """
+        Encode texts in one forward pass, bypassing the micro-batcher. With
+        `use_cache`, cached texts skip the model and the rest are cached.
+        """
+        try:
+            if not use_cache:
+                return self._encode_text_batch(list(clip.tokenize(texts)))
+            embeddings = [self.text_cache.get(text) for text in texts]
+            missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+            if missing:
+                encoded = self._encode_text_batch(list(clip.tokenize([texts[i] for i in missing])))
+                for i, embedding in zip(missing, encoded):
+                    embeddings[i] = embedding
+                    self.text_cache.put(texts[i], embedding)
+            return np.stack(embeddings)
+        except Exception as e:
+            logger.error(f"Error encoding texts: {e}")
+            raise
+
+    def _encode_image_batch(self, image_tensors: list) -> np.ndarray:
+        """One forward pass over preprocessed images"""
+        return _normalize(self._image_features(torch.stack(image_tensors)))
+
+    def _encode_text_batch(self, text_tokens: list) -> np.ndarray:
+        """One forward pass over tokenized texts"""
+        return _normalize(self._text_features(torch.stack(text_tokens)))
+
+    def _image_features(self, pixels: torch.Tensor) -> np.ndarray:
+        if self.image_session is not None:
+            return self.image_session.run(None, {"pixels": pixels.numpy()})[0]
+        with torch.no_grad():
+            return self.model.encode_image(pixels.to(self.device)).float().cpu().numpy()
+
+    def _text_features(self, tokens: torch.Tensor) -> np.ndarray:
+        if self.text_session is not None:
+            return self.text_session.run(None, {"tokens": tokens.numpy()})[0]
+        with torch.no_grad():
+            return self.model.encode_text(tokens.to(self.device)).float().cpu().numpy()
+
+    def batch_stats(self) -> dict:
+        """Batch size counters for the image and text encoders"""
+        return {"image": self.image_batcher.stats(), "text": self.text_batcher.stats()}
+
+    def close(self):
+        self.image_batcher.close()
+        self.text_batcher.close()
+        self.text_cache.close()
+
+class _ImageEncoder(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixels):
+        return self.model.encode_image(pixels)
+
+class _TextEncoder(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, tokens):
+        return self.model.encode_text(tokens)
+
+def _export_onnx(module: torch.nn.Module, example: torch.Tensor, input_name: str, path: str):
+    """Export with a dynamic batch axis, written aside and renamed so workers never load a partial file"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            module, (example,), tmp_path,
+            input_names=[input_name], output_names=["features"],
+            dynamic_axes={input_name: {0: "batch"}, "features": {0: "batch"}},
+            opset_version=17
+        )
+    os.replace(tmp_path, path)
+    logger.info(f"Exported CLIP encoder to {path}")
+
+def _normalize(features: np.ndarray) -> np.ndarray:
+    return (features / np.linalg.norm(features, axis=-1, keepdims=True)).astype('float32')
+
 # Global CLIP model instance
 clip_model = None
+clip_model_lock = threading.Lock()
 
 def get_clip_model():
     global clip_model
     if clip_model is None:
-        clip_model = CLIPModel()
+        # Startup loads this in the background; requests arriving meanwhile wait here
+        with clip_model_lock:
+            if clip_model is None:
+                clip_model = CLIPModel()
     return clip_model
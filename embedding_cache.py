@@ -0,0 +1,146 @@
+from collections import OrderedDict
+import numpy as np
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# In-memory tier size; a 512-d float32 embedding plus its key is about 2 KB
+MAX_MEMORY_MB = float(os.getenv("TEXT_CACHE_MAX_MB", "32"))
+# Seconds an entry stays valid in either tier, 0 = forever
+TTL_SECONDS = float(os.getenv("TEXT_CACHE_TTL", "86400"))
+# SQLite file for the on-disk tier, empty to keep the cache in memory only
+DISK_PATH = os.getenv("TEXT_CACHE_PATH", "")
+
+def normalize_query(text: str) -> str:
+    """Queries that CLIP tokenizes identically share one cache entry"""
+    return " ".join(text.lower().split())
+
+class EmbeddingCache:
+    """
+    LRU + TTL cache of query text -> embedding, bounded by memory.
+
+    Misses in memory fall back to an optional SQLite tier, which survives
+    restarts and is shared by every worker pointing at the same file.
+    Entries are namespaced by `model` so switching encoders never serves
+    stale vectors.
+    """
+
+    def __init__(self, model: str, max_bytes: int = None, ttl: float = TTL_SECONDS, disk_path: str = DISK_PATH):
+        self.model = model
+        self.max_bytes = max_bytes if max_bytes is not None else int(MAX_MEMORY_MB * 1024 * 1024)
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (embedding, expires_at)
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = None
+        if disk_path:
+            try:
+                os.makedirs(os.path.dirname(disk_path) or ".", exist_ok=True)
+                self.db = sqlite3.connect(disk_path, check_same_thread=False)
+                self.db.execute("PRAGMA journal_mode=WAL")
+                self.db.execute(
+                    "CREATE TABLE IF NOT EXISTS text_embeddings ("
+                    "model TEXT, query TEXT, embedding BLOB, created_at REAL, PRIMARY KEY (model, query))"
+                )
+                if ttl:
+                    self.db.execute("DELETE FROM text_embeddings WHERE created_at <= ?", (time.time() - ttl,))
+                self.db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Text embedding disk cache disabled: {e}")
+                self.db = None
+
+    def get(self, text: str):
+        """Cached embedding for `text`, or None"""
+        key = normalize_query(text)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                embedding, expires_at = entry
+                if expires_at > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return embedding
+                self._evict(key)
+
+            embedding = self._disk_get(key, now)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, embedding, now)
+            return embedding
+
+    def put(self, text: str, embedding: np.ndarray):
+        key = normalize_query(text)
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.flags.writeable = False  # Shared between callers
+        now = time.time()
+        with self.lock:
+            self._remember(key, embedding, now)
+            if self.db is not None:
+                try:
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO text_embeddings VALUES (?, ?, ?, ?)",
+                        (self.model, key, embedding.tobytes(), now)
+                    )
+                    self.db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Error writing text embedding cache: {e}")
+
+    def _disk_get(self, key: str, now: float):
+        if self.db is None:
+            return None
+        try:
+            row = self.db.execute(
+                "SELECT embedding, created_at FROM text_embeddings WHERE model = ? AND query = ?",
+                (self.model, key)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Error reading text embedding cache: {e}")
+            return None
+        if row is None or (self.ttl and row[1] + self.ttl <= now):
+            return None
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def _remember(self, key: str, embedding: np.ndarray, now: float):
+        if key in self.entries:
+            self._evict(key)
+        expires_at = now + self.ttl if self.ttl else float("inf")
+        self.entries[key] = (embedding, expires_at)
+        self.bytes += _size(key, embedding)
+        while self.bytes > self.max_bytes and self.entries:
+            self._evict(next(iter(self.entries)))
+
+    def _evict(self, key: str):
+        embedding, _ = self.entries.pop(key)
+        self.bytes -= _size(key, embedding)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+def _size(key: str, embedding: np.ndarray) -> int:
+    return embedding.nbytes + len(key)
@@ -0,0 +1,181 @@
+import numpy as np
+import os
+import threading
+import logging
+
+from ml.index_store import file_lock
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "ml/embeddings")
+# Rows per chunk file; a full chunk of 512-d float16 vectors is 64 MB
+EMBEDDING_CHUNK_ROWS = int(os.getenv("EMBEDDING_CHUNK_ROWS", "65536"))
+# fsync every append, so an acknowledged upload's vector survives a power loss
+EMBEDDING_FSYNC = os.getenv("EMBEDDING_STORE_FSYNC", "true").lower() == "true"
+
+class EmbeddingStore:
+    """
+    Append-only columnar copy of every indexed embedding, kept so the FAISS
+    index can be rebuilt (or switched to another index type) without
+    re-running CLIP. Layout under `root`:
+
+        <chunk>.vectors.npy   float16 (rows, dimension), sealed chunks
+        <chunk>.ids.npy       int64 image ids, one per vector row
+        <chunk>.vectors.open  raw float16 rows of the chunk being filled
+        <chunk>.ids.open      raw int64 ids of the chunk being filled
+
+    Re-indexing an image appends a new row and the last row per id wins;
+    deleted images are dropped by filtering against the database on rebuild.
+    A row is addressed by the locator "<chunk>:<row>" stored in
+    Image.embedding_path.
+    """
+
+    def __init__(
+        self, root: str = EMBEDDING_STORE_DIR, dimension: int = 512,
+        chunk_rows: int = EMBEDDING_CHUNK_ROWS, fsync: bool = EMBEDDING_FSYNC
+    ):
+        self.root = root
+        self.dimension = dimension
+        self.chunk_rows = chunk_rows
+        self.fsync = fsync
+        self._thread_lock = threading.Lock()
+        self._sealed = {}  # chunk -> memory-mapped vectors
+        os.makedirs(root, exist_ok=True)
+        self._lock_file = open(os.path.join(root, "LOCK"), "a+b")
+
+    def lock(self):
+        """Exclusive across threads and worker processes"""
+        return file_lock(self._thread_lock, self._lock_file)
+
+    def _path(self, chunk: int, name: str) -> str:
+        return os.path.join(self.root, f"{chunk:08d}.{name}")
+
+    def _sealed_chunks(self) -> list[int]:
+        return sorted(int(name[:8]) for name in os.listdir(self.root) if name.endswith(".ids.npy"))
+
+    def _open_chunk(self) -> tuple[int, int]:
+        """(chunk being filled, rows it holds), repairing a write or seal that died midway"""
+        sealed = self._sealed_chunks()
+        for name in os.listdir(self.root):
+            if name.endswith(".open") and int(name[:8]) in sealed:
+                os.remove(os.path.join(self.root, name))
+        chunk = sealed[-1] + 1 if sealed else 1
+
+        ids_path, vectors_path = self._path(chunk, "ids.open"), self._path(chunk, "vectors.open")
+        id_rows = os.path.getsize(ids_path) // 8 if os.path.exists(ids_path) else 0
+        vector_rows = os.path.getsize(vectors_path) // (2 * self.dimension) if os.path.exists(vectors_path) else 0
+        rows = min(id_rows, vector_rows)
+        for path, row_size in ((ids_path, 8), (vectors_path, 2 * self.dimension)):
+            if os.path.exists(path) and os.path.getsize(path) != rows * row_size:
+                os.truncate(path, rows * row_size)
+        return chunk, rows
+
+    def append(self, image_ids: list[int], embeddings: np.ndarray) -> list[str]:
+        """Store (n, dimension) embeddings for `image_ids`; returns their locators"""
+        embeddings = np.asarray(embeddings).reshape(-1, self.dimension)
+        if len(image_ids) != len(embeddings):
+            raise ValueError(f"{len(image_ids)} image ids for {len(embeddings)} embeddings")
+
+        with self.lock():
+            chunk, rows = self._open_chunk()
+            # Vectors first: a row only exists once its id is written too
+            self._append(self._path(chunk, "vectors.open"), np.ascontiguousarray(embeddings, dtype=np.float16).tobytes())
+            self._append(self._path(chunk, "ids.open"), np.asarray(image_ids, dtype=np.int64).tobytes())
+            locators = [f"{chunk:08d}:{rows + i}" for i in range(len(image_ids))]
+            if rows + len(image_ids) >= self.chunk_rows:
+                self._seal(chunk)
+        return locators
+
+    def _append(self, path: str, data: bytes):
+        with open(path, "ab") as f:
+            f.write(data)
+            self._sync(f)
+
+    def _sync(self, f):
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def _seal(self, chunk: int):
+        """Turn the open chunk into .npy files (call while holding `lock()`)"""
+        ids, vectors = self._read_open(chunk)
+        for name, array in (("vectors", vectors), ("ids", ids)):
+            tmp_path = self._path(chunk, f"{name}.tmp.npy")
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+                self._sync(f)
+            os.replace(tmp_path, self._path(chunk, f"{name}.npy"))
+        os.remove(self._path(chunk, "vectors.open"))
+        os.remove(self._path(chunk, "ids.open"))
+        logger.info(f"Sealed embedding chunk {chunk} with {len(ids)} vectors")
+
+    def _read_open(self, chunk: int) -> tuple[np.ndarray, np.ndarray]:
+        ids_path, vectors_path = self._path(chunk, "ids.open"), self._path(chunk, "vectors.open")
+        if not os.path.exists(ids_path):
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dimension), dtype=np.float16)
+        ids = np.fromfile(ids_path, dtype=np.int64)
+        vectors = np.fromfile(vectors_path, dtype=np.float16).reshape(-1, self.dimension)
+        rows = min(len(ids), len(vectors))
+        return ids[:rows], vectors[:rows]
+
+    def get(self, locator: str):
+        """The float32 embedding at `locator`, or None if there is none"""
+        try:
+            chunk, row = (int(part) for part in locator.split(":"))
+        except (AttributeError, ValueError):
+            return None
+        vectors = self._sealed.get(chunk)
+        if vectors is None:
+            with self.lock():
+                if not os.path.exists(self._path(chunk, "ids.npy")):
+                    return self._read_open_row(chunk, row)
+                vectors = self._sealed[chunk] = np.load(self._path(chunk, "vectors.npy"), mmap_mode="r")
+        if row >= len(vectors):
+            return None
+        return np.asarray(vectors[row], dtype=np.float32)
+
+    def _read_open_row(self, chunk: int, row: int):
+        """One row of the chunk being filled, without reading the rest of it"""
+        ids_path, vectors_path = self._path(chunk, "ids.open"), self._path(chunk, "vectors.open")
+        row_size = 2 * self.dimension
+        if not os.path.exists(ids_path) or os.path.getsize(ids_path) < (row + 1) * 8:
+            return None
+        if os.path.getsize(vectors_path) < (row + 1) * row_size:
+            return None
+        vector = np.fromfile(vectors_path, dtype=np.float16, count=self.dimension, offset=row * row_size)
+        return vector.astype(np.float32)
+
+    def read_all(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Every image's latest embedding
+        Returns: (int64 ids, float16 (n, dimension) vectors), in insertion order
+        """
+        with self.lock():
+            chunk, _ = self._open_chunk()
+            parts = [
+                (np.load(self._path(sealed, "ids.npy")), np.load(self._path(sealed, "vectors.npy")))
+                for sealed in self._sealed_chunks()
+            ]
+            parts.append(self._read_open(chunk))
+        ids = np.concatenate([part_ids for part_ids, _ in parts])
+        vectors = np.concatenate([part_vectors for _, part_vectors in parts])
+        # Keep each id's last row
+        _, last = np.unique(ids[::-1], return_index=True)
+        keep = np.sort(len(ids) - 1 - last)
+        return ids[keep], vectors[keep]
+
+    def close(self):
+        self._sealed.clear()
+        self._lock_file.close()
+
+# Global embedding store instance
+embedding_store = None
+embedding_store_lock = threading.Lock()
+
+def get_embedding_store():
+    global embedding_store
+    if embedding_store is None:
+        with embedding_store_lock:
+            if embedding_store is None:
+                embedding_store = EmbeddingStore()
+    return embedding_store
@@ -2,93 +2,687 @@ import faiss
 import numpy as np
 import pickle
 import os
+import threading
 import logging
 
+from ml.index_store import IndexStore, OP_ADD, OP_REMOVE, NO_OWNER
+
 logger = logging.getLogger(__name__)
 
+# Checkpoint after this many WAL records; uploads in between only append to the WAL
+CHECKPOINT_INTERVAL = int(os.getenv("FAISS_CHECKPOINT_INTERVAL", "1000"))
+WAL_FSYNC = os.getenv("FAISS_WAL_FSYNC", "true").lower() == "true"
+# "memory" loads checkpoints into process RAM, "mmap" maps them read-only so all
+# uvicorn workers share one page-cache copy (flat codes need faiss >= 1.10)
+STORAGE_MODE = os.getenv("FAISS_STORAGE", "memory")
+# faiss.index_factory string for checkpointed vectors, e.g. "Flat", "HNSW32",
+# "IVF{nlist},Flat" or "IVF{nlist},PQ64"; {nlist} is sized from the corpus at training time
+INDEX_FACTORY = os.getenv("FAISS_INDEX_FACTORY", "Flat")
+TRAIN_MIN = int(os.getenv("FAISS_TRAIN_MIN", "10000"))
+# Retrain IVF/PQ once the corpus outgrows the training set by this factor
+RETRAIN_GROWTH = float(os.getenv("FAISS_RETRAIN_GROWTH", "4"))
+DEFAULT_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+DEFAULT_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+# Users with at most this many vectors are scored exactly from reconstructed vectors
+EXACT_USER_LIMIT = int(os.getenv("FAISS_EXACT_USER_LIMIT", "2048"))
+# Compact (rebuild without deleted vectors) once this fraction of the index is tombstoned
+COMPACT_RATIO = float(os.getenv("FAISS_COMPACT_RATIO", "0.1"))
+
+# Checkpoints whose indexes are labelled with image ids rather than positions
+ID_LAYOUT = 2
+
 class FAISSIndex:
-    def __init__(self, dimension: int = 512):
+    """
+    Checkpointed vectors live in `base` (never mutated, possibly memory-mapped);
+    vectors added since the checkpoint live in the small in-memory `index`.
+    Searches merge both, checkpoints fold `index` into a new `base`.
+
+    Both indexes are labelled with image ids (IVF natively, everything else
+    through IndexIDMap2), so search results need no translation.
+
+    `base` stays exhaustive (Flat) until enough vectors exist to train the
+    configured factory; the checkpoint that crosses the threshold trains it
+    and migrates every vector, while searches keep using the old base.
+
+    Every vector carries its owner's user_id. Checkpoints store the ids
+    sorted by owner so a user's vectors are a binary search away, and
+    user-scoped searches only ever score that user's vectors.
+
+    Deleting from `index` is immediate; deleting from `base` tombstones the id,
+    which searches exclude through an ID selector, and checkpoints physically
+    drop tombstones once they exceed COMPACT_RATIO.
+    """
+
+    def __init__(
+        self, dimension: int = 512, storage: str = STORAGE_MODE, index_factory: str = INDEX_FACTORY, load: bool = True
+    ):
+        if storage not in ("memory", "mmap"):
+            raise ValueError(f"Unknown FAISS storage mode: {storage}")
         self.dimension = dimension
-        self.index = faiss.IndexFlatIP(dimension)  # Inner product for cosine similarity
-        self.image_ids = []  # Map index position to image_id
-        self.index_path = "ml/faiss_index.pkl"
-        self.load_index()
-    
+        self.storage = storage
+        self.index_factory = index_factory
+        self.base = None  # Index from the latest checkpoint
+        self.base_ids = np.empty(0, dtype=np.int64)  # Sorted image_ids in base
+        self.base_owners = np.empty(0, dtype=np.int64)  # user_id of each base_ids entry
+        self.base_owner_ids = np.empty(0, dtype=np.int64)  # base_ids ordered by owner
+        self.base_owner_sorted = np.empty(0, dtype=np.int64)  # Owners in base_owner_ids order
+        self.tombstones = set()  # Deleted image_ids still present in base
+        self.base_generation = 0
+        self.base_meta = {}
+        self.version = 0  # Bumped whenever searchable contents change, by any worker
+        self.index = _new_delta(dimension)  # Inner product for cosine similarity
+        self.owners = {}  # image_id -> user_id for vectors in index
+        self.user_ids = {}  # user_id -> image_ids in index
+        self.needs_owners = False  # Vectors from before owners were tracked
+        self.cursor = (0, 0)  # WAL position applied so far
+        self.index_path = "ml/faiss_index.pkl"  # Legacy pickle, migrated on first load
+        self.store = IndexStore(os.getenv("FAISS_INDEX_DIR", "ml/faiss"), dimension, fsync=WAL_FSYNC)
+        self.lock = threading.RLock()
+        self._checkpoint_lock = threading.Lock()
+        self._checkpoint_thread = None
+        self._publishing = None
+        if load:
+            self.load_index()
+
+    def __len__(self):
+        """Live (not deleted) vectors"""
+        return self._total() - len(self.tombstones)
+
+    def _total(self):
+        base_count = self.base.ntotal if self.base is not None else 0
+        return base_count + self.index.ntotal
+
+    def tombstone_ratio(self) -> float:
+        total = self._total()
+        return len(self.tombstones) / total if total else 0.0
+
     def load_index(self):
-        """Load FAISS index from disk if exists"""
-        if os.path.exists(self.index_path):
+        """Load the latest checkpoint from disk and replay the WAL on top of it"""
+        with self.lock:
+            if self.store.is_empty() and os.path.exists(self.index_path):
+                self._migrate_pickle()
+                return
+
             try:
-                with open(self.index_path, 'rb') as f:
-                    data = pickle.load(f)
-                    self.index = data['index']
-                    self.image_ids = data['image_ids']
-                logger.info(f"Loaded FAISS index with {len(self.image_ids)} vectors")
+                with self.store.lock():
+                    self._refresh(repair=True)
+                    upgrade_wal = self.store.wal_outdated()
+                if upgrade_wal or self._legacy_base():
+                    # Fold old-format data into a current checkpoint before serving
+                    self.checkpoint(force=True)
+                logger.info(
+                    f"Loaded FAISS index with {len(self)} vectors "
+                    f"({self.index.ntotal} replayed from WAL, storage={self.storage}, "
+                    f"type={self.base_meta.get('factory', 'Flat')})"
+                )
+                if self.base is not None and self.base_meta.get("spec", "Flat") != self.index_factory:
+                    # Factory changed since the last checkpoint: migrate in the background. Not
+                    # forced, so when every worker starts at once only the first one migrates
+                    # and the rest load its checkpoint
+                    self._start_checkpoint()
             except Exception as e:
-                logger.warning(f"Error loading index, creating new: {e}")
-                self.index = faiss.IndexFlatIP(self.dimension)
-                self.image_ids = []
+                logger.error(f"Error loading index: {e}")
+                raise
+
+    def _migrate_pickle(self):
+        """
+        Convert the old whole-index pickle into the first checkpoint. If it
+        can't be read nothing is written, so the next start retries instead of
+        publishing an empty checkpoint that would hide the pickle for good.
+        """
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = pickle.load(f)
+            index = data['index']
+            # Positional layout: base_ids[i] labels vector i
+            image_ids = np.asarray(data['image_ids'], dtype=np.int64)
+        except Exception as e:
+            logger.error(
+                f"Could not read legacy FAISS index {self.index_path}: {e}. "
+                f"Fix or move it aside (rebuild_index.py recreates the index from stored embeddings)"
+            )
+            raise
+        self.base, self.base_ids = index, image_ids
+        self.base_owners = np.full(len(image_ids), NO_OWNER, dtype=np.int64)
+        logger.info(f"Migrating pickled FAISS index with {len(image_ids)} vectors")
+        self.checkpoint(force=True)
+
+    def _legacy_base(self) -> bool:
+        return self.base is not None and self.base_meta.get("layout") != ID_LAYOUT
+
+    def _refresh(self, repair: bool = False):
+        """Catch up with checkpoints and WAL records written by any worker"""
+        generation = self.store.current_generation()
+        if generation != self.base_generation and generation != self._publishing:
+            self._load_base(generation)
+        records, self.cursor = self.store.read_wal(self.cursor, repair)
+        self._apply(records)
+
+    def _load_base(self, generation: int, index=None, arrays=None, meta=None):
+        if index is None:
+            index, arrays, meta = self.store.load_checkpoint(generation, mmap=self.storage == "mmap")
+        self.base, self.base_generation, self.base_meta = index, generation, meta
+        self.version += 1
+        self.base_ids = arrays.get("ids", np.empty(0, dtype=np.int64))
+        self.base_owners = arrays.get("owners", np.full(len(self.base_ids), NO_OWNER, dtype=np.int64))
+        tombstones = arrays.get("tombstones", np.empty(0, dtype=np.int64))
+        if meta.get("layout") == ID_LAYOUT:
+            self.base_owner_ids = arrays["owner_ids"]
+            self.base_owner_sorted = arrays["owner_sorted"]
+            self.tombstones = set(tombstones.tolist())
         else:
-            logger.info("Creating new FAISS index")
-    
+            # Positional checkpoint; load_index() rewrites it before serving
+            self.base_owner_ids = self.base_owner_sorted = np.empty(0, dtype=np.int64)
+            self.tombstones = set(np.asarray(self.base_ids)[tombstones].tolist())
+        unowned = np.asarray(self.base_ids)[np.asarray(self.base_owners) == NO_OWNER]
+        self.needs_owners = len(_live(unowned, self.tombstones)) > 0
+        # Everything after the checkpoint is re-read from its WAL
+        self.index = _new_delta(self.dimension)
+        self.owners = {}
+        self.user_ids = {}
+        self.cursor = (generation, 0)
+
+    def _apply(self, records: list):
+        if records:
+            self.version += 1
+        pending = []
+        for op, image_id, owner, vector in records:
+            if op == OP_ADD:
+                pending.append((image_id, owner, vector))
+                continue
+            # Adds are batched, but must land before a later removal of the same id
+            self._apply_adds(pending)
+            pending = []
+            if op == OP_REMOVE:
+                self._discard(image_id)
+        self._apply_adds(pending)
+
+    def _apply_adds(self, adds: list):
+        if not adds:
+            return
+        # Re-indexing an image replaces its previous vector
+        latest = {image_id: (owner, vector) for image_id, owner, vector in adds}
+        for image_id in latest:
+            self._discard(image_id)
+        ids = np.fromiter(latest, dtype=np.int64, count=len(latest))
+        self.index.add_with_ids(np.stack([vector for _, vector in latest.values()]), ids)
+        for image_id, (owner, _) in latest.items():
+            self.owners[image_id] = owner
+            self.user_ids.setdefault(owner, set()).add(image_id)
+            if owner == NO_OWNER:
+                self.needs_owners = True
+
+    def _discard(self, image_id: int) -> bool:
+        """Drop `image_id` from the in-memory index, or tombstone it in base"""
+        owner = self.owners.pop(image_id, None)
+        if owner is not None:
+            self.user_ids[owner].discard(image_id)
+            self.index.remove_ids(np.array([image_id], dtype=np.int64))
+            return True
+        if self._in_base(image_id):
+            self.tombstones.add(image_id)
+            return True
+        return False
+
+    def _in_base(self, image_id: int) -> bool:
+        i = np.searchsorted(self.base_ids, image_id)
+        return i < len(self.base_ids) and self.base_ids[i] == image_id and image_id not in self.tombstones
+
+    def contains(self, image_id: int) -> bool:
+        with self.lock:
+            return image_id in self.owners or self._in_base(image_id)
+
+    def current_version(self) -> int:
+        """Version of the searchable contents, after catching up with other workers' writes"""
+        with self.lock:
+            try:
+                self._refresh()
+            except Exception as e:
+                logger.warning(f"Could not refresh FAISS index, serving last snapshot: {e}")
+            return self.version
+
+    def get_vector(self, image_id: int):
+        """Stored embedding of `image_id` (approximate for PQ), or None if not indexed"""
+        return self.get_vectors([image_id]).get(image_id)
+
+    def get_vectors(self, image_ids: list[int]) -> dict:
+        """image_id -> stored embedding for each of `image_ids` that is indexed"""
+        vectors = {}
+        with self.lock:
+            try:
+                self._refresh()
+            except Exception as e:
+                logger.warning(f"Could not refresh FAISS index, serving last snapshot: {e}")
+            for image_id in image_ids:
+                if image_id in self.owners:
+                    vectors[image_id] = self.index.reconstruct(image_id)
+                elif self._in_base(image_id):
+                    vectors[image_id] = self.base.reconstruct(image_id)
+        return vectors
+
+    def _base_user_ids(self, user_id: int) -> np.ndarray:
+        lo, hi = np.searchsorted(self.base_owner_sorted, [user_id, user_id + 1])
+        return _live(np.asarray(self.base_owner_ids[lo:hi]), self.tombstones)
+
+    def _delta_user_ids(self, user_id: int) -> np.ndarray:
+        ids = self.user_ids.get(user_id, ())
+        return np.fromiter(ids, dtype=np.int64, count=len(ids))
+
+    def checkpoint(self, force: bool = False, owner_backfill: dict = None):
+        """
+        Fold WAL records into a new checkpoint and retire the WAL it covers.
+        `owner_backfill` maps image_id -> user_id for vectors without an owner.
+        """
+        with self._checkpoint_lock:
+            with self.lock, self.store.lock():
+                self._refresh()
+                if not force and self.cursor[0] != self.base_generation:
+                    return  # Another worker is already checkpointing
+                if (not self.index.ntotal and not owner_backfill and self.base_generation
+                        and not self._legacy_base()
+                        and self.base_meta.get("spec") == self.index_factory
+                        and self.tombstone_ratio() <= COMPACT_RATIO):
+                    return  # Nothing new to fold in
+                base, base_generation, base_meta = self.base, self.base_generation, self.base_meta
+                base_ids, base_owners = np.asarray(self.base_ids), np.asarray(self.base_owners)
+                delta_ids = faiss.vector_to_array(self.index.id_map).astype(np.int64)
+                delta_vectors = self.index.index.reconstruct_n(0, self.index.ntotal)
+                delta_owners = np.array([self.owners[i] for i in delta_ids.tolist()], dtype=np.int64)
+                tombstones = np.fromiter(self.tombstones, dtype=np.int64, count=len(self.tombstones))
+                # Base copies of re-indexed images: tombstoned, but their id lives on in the delta
+                replaced = np.intersect1d(tombstones, delta_ids)
+                compact = len(tombstones) > COMPACT_RATIO * self._total()
+                generation = self.store.rotate()
+                self._publishing = generation
+
+            # Building and writing happen outside the index lock so searches and uploads keep flowing
+            try:
+                # Both copies can't share an id in one index, so replaced ones are always dropped
+                drop = tombstones if compact else replaced
+                merged, meta = self._merge(
+                    base, base_ids, base_generation, base_meta,
+                    delta_vectors, delta_ids, drop if len(drop) else None
+                )
+                keep = ~np.isin(base_ids, drop)
+                merged_ids = np.concatenate([base_ids[keep], delta_ids])
+                merged_owners = np.concatenate([base_owners[keep], delta_owners])
+                if compact:
+                    logger.info(f"Compacted {len(tombstones)} deleted vectors out of the FAISS index")
+                    tombstones = np.empty(0, dtype=np.int64)
+                else:
+                    tombstones = np.setdiff1d(tombstones, replaced)
+                if owner_backfill:
+                    missing = np.flatnonzero(merged_owners == NO_OWNER)
+                    merged_owners[missing] = [owner_backfill.get(int(i), NO_OWNER) for i in merged_ids[missing]]
+                arrays = _checkpoint_arrays(merged_ids, merged_owners, tombstones)
+                published = self.store.write_checkpoint(generation, merged, arrays, meta)
+            finally:
+                self._publishing = None
+
+            if published:
+                self._publish(generation, merged, arrays, meta)
+                logger.info(
+                    f"Checkpointed FAISS index generation {generation} with {len(merged_ids)} vectors "
+                    f"(type={meta['factory']})"
+                )
+
+    def rebuild(self, load_vectors) -> int:
+        """
+        Replace every checkpointed vector with a fresh index of the configured
+        factory built from `load_vectors()`, which returns (image_ids,
+        embeddings, owners). It is called after the WAL rotates, so writes
+        racing the rebuild are replayed on top of the result.
+        Returns: number of vectors in the rebuilt checkpoint
+        """
+        with self._checkpoint_lock:
+            # The current checkpoint is never read: everything comes from load_vectors()
+            with self.lock, self.store.lock():
+                generation = self.store.rotate()
+                self._publishing = generation
+
+            try:
+                ids, vectors, owners = load_vectors()
+                order = np.argsort(ids)
+                ids = np.asarray(ids, dtype=np.int64)[order]
+                vectors = np.asarray(vectors, dtype=np.float32)[order].reshape(-1, self.dimension)
+                owners = np.asarray(owners, dtype=np.int64)[order]
+                built, meta = self._merge(None, np.empty(0, dtype=np.int64), 0, {}, vectors, ids)
+                arrays = _checkpoint_arrays(ids, owners, np.empty(0, dtype=np.int64))
+                published = self.store.write_checkpoint(generation, built, arrays, meta)
+            finally:
+                self._publishing = None
+
+            if not published:
+                raise RuntimeError("A newer FAISS checkpoint was published during the rebuild")
+            self._publish(generation, built, arrays, meta)
+            logger.info(f"Rebuilt FAISS index generation {generation} with {len(ids)} vectors (type={meta['factory']})")
+            return len(ids)
+
+    def _publish(self, generation: int, index, arrays: dict, meta: dict):
+        """Serve a checkpoint this process just wrote"""
+        with self.lock:
+            if self.storage == "mmap":
+                self._load_base(generation)
+            else:
+                self._load_base(generation, index, arrays, meta)
+            self._refresh()
+
+    def _merge(
+        self, base, base_ids: np.ndarray, base_generation: int, base_meta: dict,
+        delta_vectors: np.ndarray, delta_ids: np.ndarray, drop=None
+    ):
+        """
+        Build the next checkpoint's index from `base` plus the delta vectors,
+        without the base vectors of the image ids in `drop` when given
+        Returns: (index, meta)
+        """
+        base_count = base.ntotal if base is not None else 0
+        total = base_count + len(delta_ids) - (len(drop) if drop is not None else 0)
+        target = self._target_factory(total)
+        legacy = base is not None and base_meta.get("layout") != ID_LAYOUT
+        migrate = (
+            base is None
+            or legacy
+            or base_meta.get("spec", "Flat") != self.index_factory
+            or (target != "Flat" and base_meta.get("factory", "Flat") == "Flat")
+            or (base_meta.get("trained_on") and total > RETRAIN_GROWTH * base_meta["trained_on"])
+        )
+
+        if not migrate:
+            if self.storage == "mmap" and base_generation:
+                # A mapped index is read-only; merge into a private RAM copy
+                merged, _, _ = self.store.load_checkpoint(base_generation)
+            else:
+                merged = faiss.clone_index(base)
+            try:
+                if drop is not None:
+                    merged.remove_ids(drop)
+                if len(delta_ids):
+                    merged.add_with_ids(delta_vectors, delta_ids)
+                return merged, base_meta
+            except RuntimeError:
+                # HNSW can't remove in place; compact by rebuilding the same index type
+                target = base_meta.get("factory", target)
+
+        vectors, ids = delta_vectors, delta_ids
+        if base_count:
+            if legacy:
+                # Positional layout: vector i belongs to base_ids[i]
+                base_vectors = base.reconstruct_n(0, base_count)
+            else:
+                base_vectors = base.reconstruct_batch(base_ids)
+            kept_ids = base_ids
+            if drop is not None:
+                # Only base copies go; a dropped id may have been re-added in the delta
+                keep = ~np.isin(base_ids, drop)
+                base_vectors, kept_ids = base_vectors[keep], base_ids[keep]
+            vectors, ids = np.vstack([base_vectors, delta_vectors]), np.concatenate([kept_ids, delta_ids])
+        merged = _new_base(self.dimension, target)
+        trained_on = None
+        if not merged.is_trained:
+            sample = vectors
+            if len(sample) > 256 * _nlist(merged):
+                rows = np.random.default_rng(0).choice(len(sample), 256 * _nlist(merged), replace=False)
+                sample = vectors[rows]
+            logger.info(f"Training FAISS index {target} on {len(sample)} vectors")
+            merged.train(sample)
+            trained_on = total
+        merged.add_with_ids(vectors, ids)
+        if base_meta.get("factory", "Flat") != target:
+            logger.info(f"Migrated FAISS index from {base_meta.get('factory', 'Flat')} to {target}")
+        meta = {"spec": self.index_factory, "factory": target, "trained_on": trained_on, "layout": ID_LAYOUT}
+        return merged, meta
+
+    def _target_factory(self, total: int) -> str:
+        """Resolve the configured factory for `total` vectors, or "Flat" until it can be trained"""
+        factory = self.index_factory.format(nlist=int(min(65536, max(16, 4 * np.sqrt(total)))))
+        candidate = faiss.index_factory(self.dimension, factory, faiss.METRIC_INNER_PRODUCT)
+        if not candidate.is_trained and total < max(TRAIN_MIN, 39 * _nlist(candidate)):
+            return "Flat"
+        return factory
+
     def save_index(self):
         """Save FAISS index to disk"""
         try:
-            os.makedirs("ml", exist_ok=True)
-            with open(self.index_path, 'wb') as f:
-                pickle.dump({
-                    'index': self.index,
-                    'image_ids': self.image_ids
-                }, f)
-            logger.info(f"Saved FAISS index with {len(self.image_ids)} vectors")
+            self.checkpoint(force=True)
         except Exception as e:
             logger.error(f"Error saving index: {e}")
-    
-    def add_vector(self, embedding: np.ndarray, image_id: int):
+
+    def _maybe_checkpoint(self):
+        if self.index.ntotal >= CHECKPOINT_INTERVAL:
+            self._start_checkpoint()
+
+    def _start_checkpoint(self, force: bool = False):
+        if self._checkpoint_thread is not None and self._checkpoint_thread.is_alive():
+            return
+        self._checkpoint_thread = threading.Thread(target=self.checkpoint, args=(force,), daemon=True)
+        self._checkpoint_thread.start()
+
+    def assign_owners(self, owners: dict):
+        """Record user_ids for vectors indexed before owners were tracked"""
+        self.checkpoint(force=True, owner_backfill=owners)
+
+    def unowned_image_ids(self) -> list[int]:
+        with self.lock:
+            base_ids = np.asarray(self.base_ids)
+            unowned = _live(base_ids[np.asarray(self.base_owners) == NO_OWNER], self.tombstones)
+            return unowned.tolist() + self._delta_user_ids(NO_OWNER).tolist()
+
+    def add_vector(self, embedding: np.ndarray, image_id: int, user_id: int = NO_OWNER):
         """Add embedding vector to index"""
         if embedding.shape[0] != self.dimension:
             raise ValueError(f"Embedding dimension {embedding.shape[0]} != {self.dimension}")
-        
-        embedding = embedding.reshape(1, -1).astype('float32')
-        self.index.add(embedding)
-        self.image_ids.append(image_id)
-        self.save_index()
-    
-    def search(self, query_embedding: np.ndarray, top_k: int = 5) -> list[tuple[int, float]]:
+        self.add_vectors(embedding.reshape(1, -1), [image_id], user_id)
+
+    def add_vectors(self, embeddings: np.ndarray, image_ids: list[int], user_id: int = NO_OWNER):
+        """Add a batch of embeddings owned by one user with a single WAL write"""
+        if embeddings.ndim != 2 or embeddings.shape[1] != self.dimension:
+            raise ValueError(f"Embeddings shape {embeddings.shape} != (n, {self.dimension})")
+        if len(image_ids) != len(embeddings):
+            raise ValueError(f"{len(image_ids)} image ids for {len(embeddings)} embeddings")
+
+        embeddings = embeddings.astype('float32')
+        records = [(OP_ADD, int(image_id), user_id, embedding) for image_id, embedding in zip(image_ids, embeddings)]
+        with self.lock:
+            with self.store.lock():
+                # Apply other workers' records first so our cursor stays at the WAL tail
+                self._refresh()
+                # Log first so an acknowledged upload survives a crash
+                self.cursor = self.store.append_many(self.cursor, records)
+            self._apply(records)
+        self._maybe_checkpoint()
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int = 5,
+        nprobe: int = None,
+        ef_search: int = None,
+        user_id: int = None
+    ) -> list[tuple[int, float]]:
         """
-        Search for similar vectors
+        Search for similar vectors. `nprobe` (IVF) and `ef_search` (HNSW) trade
+        recall for latency and are ignored by index types that don't use them.
+        With `user_id`, only that user's vectors are considered, so top_k is
+        met whenever the user owns at least top_k images.
         Returns: list of (image_id, similarity_score) tuples
         """
-        if len(self.image_ids) == 0:
-            return []
-        
-        query_embedding = query_embedding.reshape(1, -1).astype('float32')
-        distances, indices = self.index.search(query_embedding, min(top_k, len(self.image_ids)))
-        
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx < len(self.image_ids):
-                image_id = self.image_ids[idx]
-                similarity = float(distances[0][i])
-                results.append((image_id, similarity))
-        
+        return self.search_batch(query_embedding.reshape(1, -1), top_k, nprobe, ef_search, user_id)[0]
+
+    def search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+        nprobe: int = None,
+        ef_search: int = None,
+        user_id: int = None
+    ) -> list[list[tuple[int, float]]]:
+        """
+        search() for an (nq, dimension) matrix of queries, with one index call per part
+        Returns: one list of (image_id, similarity_score) tuples per query
+        """
+        queries = np.asarray(query_embeddings, dtype='float32').reshape(-1, self.dimension)
+        with self.lock:
+            try:
+                self._refresh()
+            except Exception as e:
+                logger.warning(f"Could not refresh FAISS index, serving last snapshot: {e}")
+
+            if len(self) == 0:
+                return [[] for _ in range(len(queries))]
+
+            nprobe, ef_search = nprobe or DEFAULT_NPROBE, ef_search or DEFAULT_EF_SEARCH
+            if user_id is None:
+                # Bound to a local so the selector outlives the search using it
+                sel = _excluding(self.tombstones)
+                base_results = _search_part(
+                    self.base, queries, top_k, _search_params(self.base, nprobe, ef_search, sel)
+                )
+                delta_results = _search_part(self.index, queries, top_k)
+            else:
+                base_results = _search_user_part(
+                    self.base, self._base_user_ids(user_id), queries, top_k, nprobe, ef_search
+                )
+                delta_results = _search_user_part(
+                    self.index, self._delta_user_ids(user_id), queries, top_k, nprobe, ef_search
+                )
+
+        return [
+            sorted(base + delta, key=lambda result: result[1], reverse=True)[:top_k]
+            for base, delta in zip(base_results, delta_results)
+        ]
+
+    def remove_vector(self, image_id: int) -> bool:
+        """
+        Remove vector from index. Vectors in the checkpointed base are
+        tombstoned and dropped for good by the next compacting checkpoint.
+        Returns: False if the image was not indexed
+        """
+        with self.lock:
+            with self.store.lock():
+                self._refresh()
+                if not self.contains(image_id):
+                    return False
+                self.cursor = self.store.append(
+                    self.cursor, OP_REMOVE, image_id, NO_OWNER, np.zeros(self.dimension, dtype=np.float32)
+                )
+            self._apply([(OP_REMOVE, image_id, NO_OWNER, None)])
+            compact = self.tombstone_ratio() > COMPACT_RATIO
+        if compact:
+            self._start_checkpoint(force=True)
+        return True
+
+    def close(self):
+        """Checkpoint outstanding WAL records and release file handles"""
+        if self._checkpoint_thread is not None:
+            self._checkpoint_thread.join()
+        if self.index.ntotal:
+            self.save_index()
+        self.store.close()
+
+def _checkpoint_arrays(ids: np.ndarray, owners: np.ndarray, tombstones: np.ndarray) -> dict:
+    """Id columns of a checkpoint: ids sorted, plus the same ids ordered by owner"""
+    order = np.argsort(ids)
+    ids, owners = ids[order], owners[order]
+    owner_order = np.argsort(owners, kind="stable")
+    return {
+        "ids": ids,
+        "owners": owners,
+        "owner_ids": ids[owner_order],
+        "owner_sorted": owners[owner_order],
+        "tombstones": tombstones,
+    }
+
+def _new_delta(dimension: int):
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+
+def _new_base(dimension: int, factory: str):
+    """Empty index for `factory` that accepts add_with_ids and reconstructs by id"""
+    index = faiss.index_factory(dimension, factory, faiss.METRIC_INNER_PRODUCT)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        # IVF stores ids itself; the hashtable direct map adds reconstruct/remove by id
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+    return faiss.IndexIDMap2(index)
+
+def _nlist(index) -> int:
+    ivf = faiss.try_extract_index_ivf(index)
+    return ivf.nlist if ivf is not None else 256  # 256 = PQ codebook size
+
+def _search_params(index, nprobe: int, ef_search: int, sel=None):
+    """Per-query SearchParameters, so concurrent searches don't share mutable knobs"""
+    if index is None:
+        return None
+    if faiss.try_extract_index_ivf(index) is not None:
+        return faiss.SearchParametersIVF(nprobe=nprobe, sel=sel)
+    inner = faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexIDMap2):
+        inner = faiss.downcast_index(inner.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search, sel=sel)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+def _excluding(image_ids: set):
+    """Selector skipping tombstoned ids, or None when nothing is deleted"""
+    if not image_ids:
+        return None
+    return faiss.IDSelectorNot(faiss.IDSelectorBatch(np.fromiter(image_ids, dtype=np.int64, count=len(image_ids))))
+
+def _live(image_ids: np.ndarray, tombstones: set) -> np.ndarray:
+    if not tombstones:
+        return image_ids
+    return image_ids[~np.isin(image_ids, np.fromiter(tombstones, dtype=np.int64, count=len(tombstones)))]
+
+def _search_part(index, queries: np.ndarray, top_k: int, params=None) -> list[list[tuple[int, float]]]:
+    if index is None or index.ntotal == 0:
+        return [[] for _ in range(len(queries))]
+
+    distances, labels = index.search(queries, min(top_k, index.ntotal), params=params)
+    found = labels >= 0
+    return [
+        list(zip(labels[i][found[i]].tolist(), distances[i][found[i]].tolist()))
+        for i in range(len(queries))
+    ]
+
+def _search_user_part(
+    index, image_ids: np.ndarray, queries: np.ndarray,
+    top_k: int, nprobe: int, ef_search: int
+) -> list[list[tuple[int, float]]]:
+    """Search only `image_ids` of `index`, at a cost proportional to their count"""
+    if index is None or len(image_ids) == 0:
+        return [[] for _ in range(len(queries))]
+
+    wanted = min(top_k, len(image_ids))
+    results = [None] * len(queries)
+    if len(image_ids) > EXACT_USER_LIMIT:
+        sel = faiss.IDSelectorBatch(image_ids)
+        params = _search_params(index, nprobe, ef_search, sel)
+        for i, found in enumerate(_search_part(index, queries, top_k, params)):
+            if len(found) >= wanted:
+                results[i] = found
+        # Queries whose neighbourhood the approximate index missed fall through to exact scoring
+    missed = [i for i, found in enumerate(results) if found is None]
+    if not missed:
         return results
-    
-    def remove_vector(self, image_id: int):
-        """Remove vector from index (rebuild index)"""
-        if image_id not in self.image_ids:
-            return
-        
-        # FAISS doesn't support deletion, so we rebuild
-        idx = self.image_ids.index(image_id)
-        # Note: This is a simplified version. For production, consider using
-        # a different approach or accept that deletions require rebuilding
-        logger.warning("FAISS index removal not fully implemented - requires rebuild")
+
+    vectors = index.reconstruct_batch(image_ids)
+    scores = queries[missed] @ vectors.T
+    best = np.argpartition(-scores, wanted - 1, axis=1)[:, :wanted]
+    for row, i in enumerate(missed):
+        results[i] = list(zip(image_ids[best[row]].tolist(), scores[row, best[row]].tolist()))
+    return results
 
 # Global FAISS index instance
 faiss_index = None
+faiss_index_lock = threading.Lock()
 
 def get_faiss_index():
     global faiss_index
     if faiss_index is None:
-        faiss_index = FAISSIndex()
+        with faiss_index_lock:
+            if faiss_index is None:
+                faiss_index = FAISSIndex()
     return faiss_index
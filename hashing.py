@@ -1,7 +1,21 @@
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
 import bcrypt
 
+# bcrypt work factor for new hashes; each step doubles the cost. Existing
+# hashes keep verifying with the cost they were created with
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Processes doing bcrypt, so a login burst can use at most this many cores
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+# Hashes allowed in flight or queued; beyond this login/register answer 503
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "64"))
+
 def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
@@ -10,3 +24,73 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         plain_password.encode('utf-8'),
         hashed_password.encode('utf-8')
     )
+
+class HasherBusyError(Exception):
+    """Raised when HASH_MAX_PENDING hashes are already waiting"""
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a small dedicated process pool. Callers await the result
+    without holding an event loop or threadpool slot, and the pool size caps
+    the CPU a burst of logins can take from search traffic.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        # spawn, since forking a process that has loaded torch can deadlock
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def _run(self, fn, *args):
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HasherBusyError("Too many password hashes in progress")
+            self.pending += 1
+        start = time.monotonic()
+        try:
+            return await asyncio.wrap_future(self.executor.submit(fn, *args))
+        finally:
+            elapsed = time.monotonic() - start
+            with self.lock:
+                self.pending -= 1
+                self.completed += 1
+                self.seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+
+    def stats(self) -> dict:
+        """Counters; latencies include time queued behind other hashes"""
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "rounds": BCRYPT_ROUNDS,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_seconds": round(self.seconds / self.completed, 4) if self.completed else 0.0,
+                "max_seconds": round(self.max_seconds, 4),
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+# Global password hasher instance
+password_hasher = None
+
+def get_password_hasher():
+    global password_hasher
+    if password_hasher is None:
+        password_hasher = PasswordHasher()
+    return password_hasher
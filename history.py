@@ -1,36 +1,67 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 import logging
 
-from database import get_db
-from models import User, SearchHistory
+from database import get_async_db
+from models import SearchHistory
 from schemas import SearchHistoryItem
-from auth.jwt import get_current_user
+from auth.jwt import get_current_user_id
+from services.history_writer import get_history_writer
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api", tags=["history"])
 
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
 @router.get("/history/{user_id}", response_model=List[SearchHistoryItem])
-def get_search_history(
+async def get_search_history(
     user_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE, description="Entries per page"),
+    cursor: Optional[int] = Query(None, description="X-Next-Cursor header of the previous page"),
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get search history for a user"""
+    """
+    Get search history for a user, newest first, one page at a time.
+    When more entries exist the X-Next-Cursor header holds the cursor for the next page.
+    """
     # Verify user can access this history
-    if user_id != current_user.id:
+    if user_id != current_user_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to view this history"
         )
     
     try:
-        history = db.query(SearchHistory).filter(
-            SearchHistory.user_id == user_id
-        ).order_by(SearchHistory.searched_at.desc()).all()
+        # Show the caller's own latest searches even if they haven't been written yet
+        writer = get_history_writer()
+        if cursor is None and writer.has_pending(user_id):
+            await run_in_threadpool(writer.flush)
+        
+        query = select(SearchHistory).where(SearchHistory.user_id == user_id)
+        if cursor is not None:
+            # Keyset: continue strictly after the cursor entry in (searched_at, id) order
+            anchor = select(SearchHistory.searched_at).where(
+                SearchHistory.id == cursor,
+                SearchHistory.user_id == user_id
+            ).scalar_subquery()
+            query = query.where(or_(
+                SearchHistory.searched_at < anchor,
+                and_(SearchHistory.searched_at == anchor, SearchHistory.id < cursor)
+            ))
+        history = (await db.scalars(
+            query.order_by(SearchHistory.searched_at.desc(), SearchHistory.id.desc()).limit(limit + 1)
+        )).all()
         
+        if len(history) > limit:
+            history = history[:limit]
+            response.headers["X-Next-Cursor"] = str(history[-1].id)
         return history
     except Exception as e:
         logger.error(f"Error fetching search history: {e}")
@@ -0,0 +1,116 @@
+from datetime import datetime, timezone
+from sqlalchemy import insert
+import os
+import threading
+import logging
+
+from database import SessionLocal
+from models import SearchHistory
+
+logger = logging.getLogger(__name__)
+
+# Searches are written in one INSERT once this many are buffered, or every
+# HISTORY_FLUSH_INTERVAL seconds, whichever comes first
+HISTORY_FLUSH_SIZE = int(os.getenv("HISTORY_FLUSH_SIZE", "200"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "1.0"))
+# Entries kept while the database is unavailable; older ones are dropped beyond this
+HISTORY_MAX_BUFFER = int(os.getenv("HISTORY_MAX_BUFFER", "10000"))
+
+class HistoryWriter:
+    """
+    Buffers search history rows and writes them in bulk on a background
+    thread, so /api/search never waits on an INSERT and commit. Each row's
+    searched_at is the time of the search, not of the flush.
+    """
+
+    def __init__(self, flush_size: int = HISTORY_FLUSH_SIZE, flush_interval: float = HISTORY_FLUSH_INTERVAL,
+                 max_buffer: int = HISTORY_MAX_BUFFER):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # One flush at a time, so rows keep their order
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self.thread.start()
+
+    def record(self, user_id: int, query_text: str, results_count: int):
+        row = {
+            "user_id": user_id,
+            "query_text": query_text,
+            "results_count": results_count,
+            "searched_at": datetime.now(timezone.utc),
+        }
+        with self.lock:
+            self.buffer.append(row)
+            if len(self.buffer) > self.max_buffer:
+                del self.buffer[0]
+                self.dropped += 1
+            full = len(self.buffer) >= self.flush_size
+        if full:
+            self.wakeup.set()
+
+    def has_pending(self, user_id: int) -> bool:
+        with self.lock:
+            return any(row["user_id"] == user_id for row in self.buffer)
+
+    def flush(self):
+        """Write everything buffered so far"""
+        with self.flush_lock:
+            with self.lock:
+                rows, self.buffer = self.buffer, []
+            if not rows:
+                return
+            db = SessionLocal()
+            try:
+                db.execute(insert(SearchHistory), rows)
+                db.commit()
+                with self.lock:
+                    self.written += len(rows)
+                    self.flushes += 1
+            except Exception as e:
+                logger.error(f"Error writing {len(rows)} search history rows: {e}")
+                db.rollback()
+                # Retry with the next flush, still bounded by max_buffer
+                with self.lock:
+                    self.buffer[:0] = rows
+                    overflow = len(self.buffer) - self.max_buffer
+                    if overflow > 0:
+                        del self.buffer[:overflow]
+                        self.dropped += overflow
+            finally:
+                db.close()
+
+    def _run(self):
+        while not self.stopping:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"buffered": len(self.buffer), "written": self.written, "flushes": self.flushes, "dropped": self.dropped}
+
+    def close(self):
+        """Stop the background thread and write what is left"""
+        self.stopping = True
+        self.wakeup.set()
+        self.thread.join()
+        self.flush()
+
+# Global history writer instance
+history_writer = None
+history_writer_lock = threading.Lock()
+
+def get_history_writer():
+    global history_writer
+    if history_writer is None:
+        with history_writer_lock:
+            if history_writer is None:
+                history_writer = HistoryWriter()
+    return history_writer
@@ -1,5 +1,7 @@
 import os
 import shutil
+import hashlib
+import uuid
 from pathlib import Path
 from sqlalchemy.orm import Session
 import logging
@@ -11,19 +13,42 @@ logger = logging.getLogger(__name__)
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-def save_uploaded_file(file_content: bytes, filename: str, user_id: int) -> str:
-    """Save uploaded file and return filepath"""
-    user_upload_dir = os.path.join(UPLOAD_DIR, str(user_id))
-    os.makedirs(user_upload_dir, exist_ok=True)
+def hash_content(file_content: bytes) -> str:
+    """SHA-256 hex digest identifying an upload's bytes"""
+    return hashlib.sha256(file_content).hexdigest()
+
+def save_uploaded_file(file_content: bytes, filename: str, content_hash: str = None) -> str:
+    """
+    Save uploaded file under its content hash and return filepath.
+    Identical uploads share one file, so a known hash skips the write.
+    """
+    content_hash = content_hash or hash_content(file_content)
+    blob_dir = os.path.join(UPLOAD_DIR, "blobs", content_hash[:2])
+    os.makedirs(blob_dir, exist_ok=True)
     
-    # Generate unique filename
-    filepath = os.path.join(user_upload_dir, filename)
+    extension = os.path.splitext(filename or "")[1].lower()
+    if not extension[1:].isalnum():
+        extension = ""
+    filepath = os.path.join(blob_dir, content_hash + extension)
     
-    with open(filepath, "wb") as f:
-        f.write(file_content)
+    if not os.path.exists(filepath):
+        # Write then rename so a concurrent identical upload never sees a partial file
+        tmp_path = f"{filepath}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(file_content)
+        os.replace(tmp_path, filepath)
     
     return filepath
 
+def find_duplicate(content_hash: str, db: Session, exclude_id: int = None):
+    """An existing image with the same bytes, preferring one already classified"""
+    query = db.query(Image).filter(Image.content_hash == content_hash)
+    if exclude_id is not None:
+        query = query.filter(Image.id != exclude_id)
+    return query.order_by(
+        Image.classification.is_(None), Image.id
+    ).first()
+
 def get_image_path(image_id: int, db: Session) -> str:
     """Get filepath for an image"""
     image = db.query(Image).filter(Image.id == image_id).first()
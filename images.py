@@ -0,0 +1,83 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+
+from database import get_async_db
+from models import Image
+from schemas import ImageStatusResponse
+from auth.jwt import get_current_user_id
+from services.image_service import delete_image_file
+from services.search_service import remove_image_from_search_index
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api", tags=["images"])
+
+@router.get("/images/{image_id}/status", response_model=ImageStatusResponse)
+async def get_image_status(
+    image_id: int,
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Ingestion status of an uploaded image: pending, processing, indexed or failed"""
+    image = await db.scalar(select(Image).where(
+        Image.id == image_id,
+        Image.user_id == current_user_id
+    ))
+    
+    if not image:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+    
+    return ImageStatusResponse(
+        image_id=image.id,
+        status=image.status,
+        detail=image.status_detail,
+        classification=image.classification,
+        confidence=image.confidence
+    )
+
+@router.delete("/images/{image_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_image(
+    image_id: int,
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Delete an image, its search index entry and its file"""
+    try:
+        image = await db.scalar(select(Image).where(
+            Image.id == image_id,
+            Image.user_id == current_user_id
+        ))
+        
+        if not image:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Image not found"
+            )
+        
+        # Remove from the index first so it can't come back as a phantom hit
+        await run_in_threadpool(remove_image_from_search_index, image.id)
+        
+        filepath = image.filepath
+        await db.delete(image)
+        await db.commit()
+        # An ingestion that claimed the image earlier may have added it in between; it
+        # re-checks the row afterwards, so once the row is gone one of the two removes it
+        await run_in_threadpool(remove_image_from_search_index, image_id)
+        
+        # Identical uploads share one file; keep it while another image uses it
+        if await db.scalar(select(Image.id).where(Image.filepath == filepath).limit(1)) is None:
+            await run_in_threadpool(delete_image_file, filepath)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error deleting image: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error deleting image: {str(e)}"
+        )
@@ -0,0 +1,316 @@
+import faiss
+import numpy as np
+import json
+import os
+import shutil
+import struct
+import threading
+import zlib
+import logging
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+WAL_MAGIC = b"VQWAL"
+WAL_VERSION = 2
+WAL_HEADER = struct.Struct("<5sBI")  # magic, version, dimension
+RECORD_HEADERS = {
+    1: struct.Struct("<Bq"),  # op, image_id
+    2: struct.Struct("<Bqq"),  # op, image_id, owner (user_id, -1 if unknown)
+}
+RECORD_CRC = struct.Struct("<I")
+NO_OWNER = -1
+
+OP_ADD = 1
+OP_REMOVE = 2
+
+class IndexStore:
+    """
+    Crash-safe persistence for FAISSIndex, shared by every worker process.
+
+    Layout under `root`:
+        CURRENT               generation number of the latest complete checkpoint
+        LOCK                  inter-process lock held while appending or rotating
+        ckpt-<gen>/           index.faiss + <name>.npy arrays (ids, owners, ...) + meta.json,
+                              written before CURRENT moves
+        wal-<gen>.log         records appended after checkpoint <gen> was started
+
+    Recovery loads ckpt-<CURRENT> and replays every wal-<g>.log with g >= CURRENT,
+    so a crash at any point leaves either the old or the new checkpoint usable.
+    Readers follow the WAL with a (generation, offset) cursor, which is how
+    workers pick up each other's inserts without reloading the checkpoint.
+    """
+
+    def __init__(self, root: str, dimension: int, fsync: bool = True):
+        self.root = root
+        self.dimension = dimension
+        self.fsync = fsync
+        self._wal = None
+        self._wal_generation = None
+        self._thread_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._lock_file = open(os.path.join(root, "LOCK"), "a+b")
+
+    def lock(self):
+        """Exclusive across threads and worker processes"""
+        return file_lock(self._thread_lock, self._lock_file)
+
+    def _checkpoint_dir(self, generation: int) -> str:
+        return os.path.join(self.root, f"ckpt-{generation:06d}")
+
+    def _wal_path(self, generation: int) -> str:
+        return os.path.join(self.root, f"wal-{generation:06d}.log")
+
+    def _wal_generations(self) -> list[int]:
+        generations = []
+        for name in os.listdir(self.root):
+            if name.startswith("wal-") and name.endswith(".log"):
+                generations.append(int(name[4:-4]))
+        return sorted(generations)
+
+    def current_generation(self) -> int:
+        """Generation of the latest complete checkpoint, 0 if none was written yet"""
+        try:
+            with open(os.path.join(self.root, "CURRENT")) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def is_empty(self) -> bool:
+        return self.current_generation() == 0 and not self._wal_generations()
+
+    def load_checkpoint(self, generation: int, mmap: bool = False):
+        """
+        Read checkpoint `generation`. With `mmap` the vectors and ids stay in the
+        page cache and are shared by every process mapping the same files.
+        Returns: (index or None, dict of arrays by name, meta dict)
+        """
+        checkpoint_dir = self._checkpoint_dir(generation)
+        if generation == 0 or not os.path.isdir(checkpoint_dir):
+            return None, {}, {}
+
+        io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        index = faiss.read_index(os.path.join(checkpoint_dir, "index.faiss"), io_flags)
+        arrays = {
+            name[:-4]: np.load(os.path.join(checkpoint_dir, name), mmap_mode='r' if mmap else None)
+            for name in os.listdir(checkpoint_dir)
+            if name.endswith(".npy")
+        }
+        meta_path = os.path.join(checkpoint_dir, "meta.json")
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        return index, arrays, meta
+
+    def read_wal(self, cursor: tuple[int, int], repair: bool = False):
+        """
+        Read every intact record after `cursor` = (generation, offset).
+        Offset 0 means "from the start of that WAL".
+        Returns: (list of (op, image_id, owner, vector), new cursor)
+        """
+        generation, offset = cursor
+        records = []
+        for wal_generation in self._wal_generations():
+            if wal_generation < generation:
+                continue
+            start = offset if wal_generation == generation else 0
+            try:
+                end = self._read_wal(self._wal_path(wal_generation), start, records, repair)
+            except FileNotFoundError:
+                # Retired by a concurrent checkpoint; the caller reloads CURRENT
+                continue
+            generation, offset = wal_generation, end
+        return records, (generation, offset)
+
+    def _read_wal(self, path: str, offset: int, records: list, repair: bool) -> int:
+        with open(path, "r+b" if repair else "rb") as f:
+            version = self._read_header(f, path)
+            if version is None:
+                return 0
+            record_header = RECORD_HEADERS[version]
+            record_size = record_header.size + self.dimension * 4 + RECORD_CRC.size
+            offset = max(offset, WAL_HEADER.size)
+            f.seek(offset)
+
+            while True:
+                record = f.read(record_size)
+                if len(record) < record_size:
+                    break
+                body, (crc,) = record[:-RECORD_CRC.size], RECORD_CRC.unpack(record[-RECORD_CRC.size:])
+                if zlib.crc32(body) != crc:
+                    break
+                op, image_id, *owner = record_header.unpack_from(body)
+                vector = np.frombuffer(body, dtype=np.float32, offset=record_header.size)
+                records.append((op, image_id, owner[0] if owner else NO_OWNER, vector))
+                offset += record_size
+
+            # Drop a torn tail left by a crash mid-append so new records stay aligned
+            if repair and f.seek(0, os.SEEK_END) != offset:
+                logger.warning(f"Truncating torn WAL tail in {path} at offset {offset}")
+                f.truncate(offset)
+        return offset
+
+    def _read_header(self, f, path: str):
+        header = f.read(WAL_HEADER.size)
+        if len(header) < WAL_HEADER.size:
+            return None
+        magic, version, dimension = WAL_HEADER.unpack(header)
+        if magic != WAL_MAGIC or version not in RECORD_HEADERS or dimension != self.dimension:
+            raise ValueError(f"Unrecognised WAL file {path}")
+        return version
+
+    def wal_outdated(self) -> bool:
+        """True if the newest WAL uses an older record format and must not be appended to"""
+        generations = self._wal_generations()
+        if not generations:
+            return False
+        path = self._wal_path(generations[-1])
+        with open(path, "rb") as f:
+            version = self._read_header(f, path)
+        return version is not None and version != WAL_VERSION
+
+    def _open_wal(self, generation: int):
+        if self._wal_generation == generation:
+            return
+        if self._wal is not None:
+            self._wal.close()
+        self._wal = open(self._wal_path(generation), "ab")
+        if self._wal.tell() == 0:
+            self._wal.write(WAL_HEADER.pack(WAL_MAGIC, WAL_VERSION, self.dimension))
+            self._sync()
+        self._wal_generation = generation
+
+    def append(self, cursor: tuple[int, int], op: int, image_id: int, owner: int, vector: np.ndarray) -> tuple[int, int]:
+        """
+        Append one record at `cursor`, which must be caught up with the newest WAL
+        while holding `lock()`. Cost is independent of the index size.
+        Returns: the cursor just past the new record
+        """
+        return self.append_many(cursor, [(op, image_id, owner, vector)])
+
+    def append_many(self, cursor: tuple[int, int], records: list) -> tuple[int, int]:
+        """Append (op, image_id, owner, vector) records with a single write and sync"""
+        generation, offset = cursor
+        self._open_wal(generation)
+        end = self._wal.seek(0, os.SEEK_END)
+        if offset >= WAL_HEADER.size and end > offset:
+            # Leftover from a writer that died mid-record
+            self._wal.truncate(offset)
+        chunks = []
+        for op, image_id, owner, vector in records:
+            body = RECORD_HEADERS[WAL_VERSION].pack(op, image_id, owner) + np.ascontiguousarray(vector, dtype=np.float32).tobytes()
+            chunks.append(body + RECORD_CRC.pack(zlib.crc32(body)))
+        self._wal.write(b"".join(chunks))
+        self._sync()
+        return generation, self._wal.tell()
+
+    def _sync(self):
+        self._wal.flush()
+        if self.fsync:
+            os.fsync(self._wal.fileno())
+
+    def latest_wal_generation(self) -> int:
+        return max([self.current_generation(), *self._wal_generations()])
+
+    def rotate(self) -> int:
+        """
+        Start a fresh WAL (call while holding `lock()`) and return its
+        generation, which the next checkpoint will own.
+        """
+        generation = self.latest_wal_generation() + 1
+        self._open_wal(generation)
+        return generation
+
+    def write_checkpoint(self, generation: int, index, arrays: dict, meta: dict) -> bool:
+        """
+        Atomically publish a checkpoint covering every WAL before `generation`.
+        Returns False if a newer checkpoint was published in the meantime.
+        """
+        checkpoint_dir = self._checkpoint_dir(generation)
+        tmp_dir = checkpoint_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        faiss.write_index(index, os.path.join(tmp_dir, "index.faiss"))
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        for name in os.listdir(tmp_dir):
+            _fsync_path(os.path.join(tmp_dir, name))
+
+        with self.lock():
+            if self.current_generation() >= generation:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                return False
+
+            shutil.rmtree(checkpoint_dir, ignore_errors=True)
+            os.rename(tmp_dir, checkpoint_dir)
+
+            current_tmp = os.path.join(self.root, "CURRENT.tmp")
+            with open(current_tmp, "w") as f:
+                f.write(str(generation))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(current_tmp, os.path.join(self.root, "CURRENT"))
+
+            self._cleanup(generation)
+        return True
+
+    def _cleanup(self, generation: int):
+        """Remove checkpoints and WALs superseded by `generation`"""
+        for old in self._wal_generations():
+            if old < generation:
+                _remove(self._wal_path(old))
+        # Processes still mapping an older checkpoint keep reading the unlinked
+        # files until they notice CURRENT moved
+        for name in os.listdir(self.root):
+            if name.startswith("ckpt-") and not name.endswith(".tmp") and int(name[5:]) < generation:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def close(self):
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+            self._wal_generation = None
+
+@contextmanager
+def file_lock(thread_lock: threading.Lock, f):
+    """Hold `thread_lock` and an exclusive lock on the open file `f`, shared by every process"""
+    with thread_lock:
+        _lock_file(f)
+        try:
+            yield
+        finally:
+            _unlock_file(f)
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _fsync_path(path: str):
+    with open(path, "r+b") as f:
+        os.fsync(f.fileno())
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning(f"Could not remove {path}: {e}")
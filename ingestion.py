@@ -0,0 +1,173 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, or_
+from sqlalchemy.orm.exc import StaleDataError
+import numpy as np
+import os
+import threading
+import logging
+
+from database import SessionLocal
+from models import Image
+from services.image_service import find_duplicate
+from services.search_service import add_image_to_search_index, get_image_embedding, remove_image_from_search_index
+from ml.preprocess import get_preprocessor
+
+logger = logging.getLogger(__name__)
+
+# Concurrent ingestion jobs; more workers let CLIP micro-batches fill up
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "8"))
+# Classify new uploads during ingestion instead of on first /api/classify
+INGEST_CLASSIFY = os.getenv("INGEST_CLASSIFY", "true").lower() == "true"
+
+# A claim older than this belongs to a worker that died mid-ingestion and may be taken over
+INGEST_CLAIM_TIMEOUT = int(os.getenv("INGEST_CLAIM_TIMEOUT", "600"))
+
+STATUS_PENDING = "pending"
+STATUS_PROCESSING = "processing"
+STATUS_INDEXED = "indexed"
+STATUS_FAILED = "failed"
+
+def claimable(now: datetime):
+    """Filter for images no live worker is ingesting"""
+    stale = now - timedelta(seconds=INGEST_CLAIM_TIMEOUT)
+    return or_(
+        Image.status == STATUS_PENDING,
+        and_(Image.status == STATUS_PROCESSING, or_(Image.claimed_at.is_(None), Image.claimed_at < stale))
+    )
+
+class IngestionPipeline:
+    """
+    Runs embedding, classification and index insertion for uploaded images
+    on worker threads, so uploads return once the file and row are saved.
+    Progress is recorded in Image.status. Every uvicorn worker runs a
+    pipeline, so an image is claimed (pending -> processing) with one
+    conditional UPDATE before any work is done on it.
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.indexed = 0
+        self.failed = 0
+
+    def enqueue(self, image_id: int):
+        """Schedule a pending image for ingestion"""
+        with self.lock:
+            self.queued += 1
+        self.executor.submit(self._run, image_id)
+
+    def resume_pending(self):
+        """Re-enqueue images left pending, or claimed by a process that died"""
+        db = SessionLocal()
+        try:
+            query = db.query(Image.id).filter(claimable(datetime.now(timezone.utc)))
+            image_ids = [image_id for (image_id,) in query]
+        finally:
+            db.close()
+        for image_id in image_ids:
+            self.enqueue(image_id)
+        if image_ids:
+            logger.info(f"Resumed ingestion of {len(image_ids)} pending images")
+
+    def _run(self, image_id: int):
+        db = SessionLocal()
+        try:
+            now = datetime.now(timezone.utc)
+            claimed = db.query(Image).filter(Image.id == image_id, claimable(now)).update(
+                {"status": STATUS_PROCESSING, "claimed_at": now}, synchronize_session=False
+            )
+            db.commit()
+            if not claimed:
+                return  # Deleted, already handled, or claimed by another worker
+            image = db.query(Image).filter(Image.id == image_id).first()
+            if image is None:
+                return
+
+            try:
+                self._ingest(image, db)
+                image.status, image.status_detail = STATUS_INDEXED, None
+                with self.lock:
+                    self.indexed += 1
+            except Exception as e:
+                logger.error(f"Error ingesting image {image_id}: {e}")
+                db.rollback()
+                image.status, image.status_detail = STATUS_FAILED, str(e)
+                with self.lock:
+                    self.failed += 1
+            try:
+                db.commit()
+            except StaleDataError:
+                db.rollback()
+
+            if db.query(Image.id).filter(Image.id == image_id).first() is None:
+                # Deleted after the claim, possibly before its vector was added: drop the
+                # vector so it can't come back as a phantom hit. The store row stays, but
+                # rebuilds skip ids without an image row.
+                remove_image_from_search_index(image_id)
+                logger.info(f"Image {image_id} was deleted while being ingested")
+        except Exception as e:
+            logger.error(f"Error updating ingestion status of image {image_id}: {e}")
+        finally:
+            with self.lock:
+                self.queued -= 1
+            db.close()
+
+    def _ingest(self, image: Image, db):
+        from ml.clip_model import get_clip_model
+        clip_model = get_clip_model()
+        duplicate = find_duplicate(image.content_hash, db, exclude_id=image.id) if image.content_hash else None
+        embedding = get_image_embedding(duplicate.id, duplicate.embedding_path) if duplicate else None
+        classifier = get_ingest_classifier() if INGEST_CLASSIFY and image.classification is None else None
+
+        # Decode the file once for both models
+        transforms = {}
+        if embedding is None:
+            transforms["clip"] = clip_model.preprocess
+        if classifier is not None and not classifier.from_embedding:
+            transforms["classifier"] = classifier.to_input
+        inputs = get_preprocessor().prepare(image.filepath, transforms) if transforms else {}
+
+        if embedding is None:
+            embedding = clip_model.encode_image_input(inputs["clip"])
+        add_image_to_search_index(image.id, image.filepath, db, user_id=image.user_id, embedding=embedding)
+
+        if classifier is not None:
+            try:
+                if classifier.from_embedding:
+                    result = classifier.classify_embeddings(embedding[np.newaxis])[0]
+                else:
+                    result = classifier.classify_inputs([inputs["classifier"]])[0]
+                image.classification, image.confidence = result
+            except Exception as e:
+                # Still searchable; /api/classify retries on demand
+                logger.warning(f"Could not classify image {image.id} during ingestion: {e}")
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"queued": self.queued, "indexed": self.indexed, "failed": self.failed}
+
+    def shutdown(self):
+        """Finish running jobs; queued ones stay pending and resume on next start"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+def get_ingest_classifier():
+    try:
+        from ml.classifier import get_classifier
+        return get_classifier()
+    except Exception as e:
+        logger.warning(f"Classifier unavailable, skipping classification during ingestion: {e}")
+        return None
+
+# Global ingestion pipeline instance
+ingestion_pipeline = None
+ingestion_pipeline_lock = threading.Lock()
+
+def get_ingestion_pipeline():
+    global ingestion_pipeline
+    if ingestion_pipeline is None:
+        with ingestion_pipeline_lock:
+            if ingestion_pipeline is None:
+                ingestion_pipeline = IngestionPipeline()
+    return ingestion_pipeline
@@ -3,18 +3,22 @@ from typing import Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from dotenv import load_dotenv
 import os
 
-from database import get_db
+from database import get_async_db
 from models import User
+from auth.user_cache import get_user_cache
 
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Put the user id in new tokens so routes that only need it never look the user up
+TOKEN_INCLUDE_USER_ID = os.getenv("TOKEN_INCLUDE_USER_ID", "true").lower() == "true"
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
@@ -28,27 +32,64 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str, credentials_exception):
+def create_user_access_token(user: User, expires_delta: Optional[timedelta] = None):
+    data = {"sub": user.username}
+    if TOKEN_INCLUDE_USER_ID:
+        data["uid"] = user.id
+    return create_access_token(data, expires_delta)
+
+def credentials_error():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def decode_token(token: str, credentials_exception) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+        if payload.get("sub") is None:
             raise credentials_exception
-        return username
+        return payload
     except JWTError:
         raise credentials_exception
 
+def verify_token(token: str, credentials_exception):
+    return decode_token(token, credentials_exception)["sub"]
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    username = verify_token(token, credentials_exception)
-    user = db.query(User).filter(User.username == username).first()
+    cache = get_user_cache()
+    user = cache.get(token)
+    if user is not None:
+        return user
+
+    credentials_exception = credentials_error()
+    payload = decode_token(token, credentials_exception)
+    user = await db.scalar(select(User).where(User.username == payload["sub"]))
     if user is None:
         raise credentials_exception
+    cache.put(token, user, payload["exp"])
     return user
+
+async def get_current_user_id(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> int:
+    """The caller's user id, taken from the token itself when it carries one"""
+    user = get_user_cache().get(token)
+    if user is not None:
+        return user.id
+
+    payload = decode_token(token, credentials_error())
+    if "uid" in payload:
+        return int(payload["uid"])
+    # Token issued without a user id
+    return (await get_current_user(token, db)).id
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_cached_user(mapper, connection, target):
+    get_user_cache().invalidate_user(target.id)
@@ -0,0 +1,116 @@
+"""
+Load test: search latency during a login storm, against a running server.
+
+    python loadtest_login_storm.py --username alice --password secret --logins 32
+
+Measures /api/search latency alone, then again while --logins threads
+log in back to back, and prints both distributions. With bcrypt in the
+hashing process pool the two should be close; logins beyond
+HASH_MAX_PENDING are answered with 503 instead of queueing.
+
+Every search sends a distinct query string, so neither the search result
+cache nor the text embedding cache answers it: each one pays for a CLIP
+text encode and a FAISS search.
+"""
+import argparse
+import itertools
+import json
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Suffixes that make every query unique across both phases
+query_numbers = itertools.count()
+
+def login(base_url: str, username: str, password: str) -> tuple[int, str]:
+    data = urllib.parse.urlencode({"username": username, "password": password}).encode()
+    try:
+        with urllib.request.urlopen(f"{base_url}/api/auth/login", data=data) as response:
+            return response.status, json.load(response)["access_token"]
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+def search(base_url: str, token: str, query: str) -> float:
+    """Seconds one search took"""
+    url = f"{base_url}/api/search?" + urllib.parse.urlencode({"q": query, "top_k": 5})
+    request = urllib.request.Request(url, headers={"Authorization": f"Bearer {token}"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        response.read()
+    return time.perf_counter() - start
+
+def measure_searches(base_url: str, token: str, queries: list[str], duration: float, concurrency: int) -> list[float]:
+    latencies = []
+    deadline = time.monotonic() + duration
+
+    def worker(offset: int):
+        i = offset
+        while time.monotonic() < deadline:
+            query = f"{queries[i % len(queries)]} {next(query_numbers)}"
+            latencies.append(search(base_url, token, query))
+            i += concurrency
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    return latencies
+
+def summarize(name: str, latencies: list[float]) -> str:
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    return (f"{name:<12} n={len(latencies):<6} p50={statistics.median(latencies) * 1000:7.1f} ms  "
+            f"p95={p95 * 1000:7.1f} ms  max={latencies[-1] * 1000:7.1f} ms")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Search latency during a login storm")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--queries", nargs="+", default=["a dog", "a person", "a red car", "sunset"])
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per phase")
+    parser.add_argument("--search-concurrency", type=int, default=4)
+    parser.add_argument("--logins", type=int, default=32, help="Threads logging in during the storm phase")
+    args = parser.parse_args(argv)
+
+    status, token = login(args.url, args.username, args.password)
+    if token is None:
+        print(f"Login failed with HTTP {status}", file=sys.stderr)
+        return 1
+    # Warm up the connection and model before timing
+    search(args.url, token, args.queries[0])
+
+    baseline = measure_searches(args.url, token, args.queries, args.duration, args.search_concurrency)
+
+    stop = threading.Event()
+    outcomes = {}
+    outcomes_lock = threading.Lock()
+
+    def storm():
+        while not stop.is_set():
+            code, _ = login(args.url, args.username, args.password)
+            with outcomes_lock:
+                outcomes[code] = outcomes.get(code, 0) + 1
+
+    storm_threads = [threading.Thread(target=storm, daemon=True) for _ in range(args.logins)]
+    for thread in storm_threads:
+        thread.start()
+    try:
+        during_storm = measure_searches(args.url, token, args.queries, args.duration, args.search_concurrency)
+    finally:
+        stop.set()
+        for thread in storm_threads:
+            thread.join()
+
+    print(summarize("baseline", baseline))
+    print(summarize("login storm", during_storm))
+    print("logins by status: " + ", ".join(f"{code}={count}" for code, count in sorted(outcomes.items())))
+    slowdown = statistics.median(during_storm) / statistics.median(baseline)
+    print(f"median search slowdown during storm: {slowdown:.2f}x")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
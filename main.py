@@ -1,15 +1,18 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import logging
 import os
 
-from database import Base, engine
+from database import Base, engine, migrate_schema
+from ml.model_loader import get_model_loader
 from auth.routes import router as auth_router
 from routers.upload import router as upload_router
 from routers.classify import router as classify_router
 from routers.search import router as search_router
 from routers.history import router as history_router
+from routers.images import router as images_router
 
 # Configure logging
 logging.basicConfig(
@@ -20,6 +23,7 @@ logger = logging.getLogger(__name__)
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
+migrate_schema()
 logger.info("Database tables created")
 
 # Create FastAPI app
@@ -36,6 +40,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Static file serving for uploaded images
@@ -49,33 +54,45 @@ app.include_router(upload_router)
 app.include_router(classify_router)
 app.include_router(search_router)
 app.include_router(history_router)
+app.include_router(images_router)
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize ML models on startup"""
+    """Start loading ML models in the background; /health/ready reports when they are usable"""
     try:
-        logger.info("Initializing ML models...")
+        logger.info("Loading ML models in the background...")
+        get_model_loader().start()
         
-        # Initialize classifier
-        from ml.classifier import get_classifier
-        classifier = get_classifier()
-        logger.info("Classifier initialized")
-        
-        # Initialize CLIP model
-        from ml.clip_model import get_clip_model
-        clip_model = get_clip_model()
-        logger.info("CLIP model initialized")
-        
-        # Initialize FAISS index
-        from ml.faiss_index import get_faiss_index
-        faiss_index = get_faiss_index()
-        logger.info("FAISS index initialized")
-        
-        logger.info("All ML models initialized successfully")
+        # Pick up uploads that were still pending when the last process stopped;
+        # their workers wait for the models to finish loading
+        from services.ingestion import get_ingestion_pipeline
+        get_ingestion_pipeline().resume_pending()
     except Exception as e:
-        logger.error(f"Error initializing ML models: {e}")
+        logger.error(f"Error starting ML model loading: {e}")
         # Continue anyway - models will load lazily
 
+@app.on_event("shutdown")
+def shutdown_event():
+    """Checkpoint the FAISS index so the next start replays an empty WAL"""
+    from ml import clip_model, faiss_index, preprocess
+    from services import ingestion
+    from auth import hashing
+    from services import history_writer
+    get_model_loader().shutdown()
+    if history_writer.history_writer is not None:
+        history_writer.history_writer.close()
+    if hashing.password_hasher is not None:
+        hashing.password_hasher.shutdown()
+    if ingestion.ingestion_pipeline is not None:
+        ingestion.ingestion_pipeline.shutdown()
+    if preprocess.preprocessor is not None:
+        preprocess.preprocessor.shutdown()
+    if clip_model.clip_model is not None:
+        clip_model.clip_model.close()
+    if faiss_index.faiss_index is not None:
+        faiss_index.faiss_index.close()
+        logger.info("FAISS index checkpointed")
+
 @app.get("/")
 def root():
     return {
@@ -86,8 +103,47 @@ def root():
 
 @app.get("/health")
 def health_check():
+    """Liveness only; see /health/ready"""
     return {"status": "healthy"}
 
+@app.get("/health/live")
+def liveness_check():
+    """The process is up and serving requests, whether or not models have loaded"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def readiness_check():
+    """Per-component load state and timings; 503 until the models search needs are loaded"""
+    status = get_model_loader().status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/metrics")
+def metrics():
+    """CLIP micro-batching, cache and ingestion counters"""
+    from ml import clip_model
+    from services import history_writer, ingestion, metadata_cache, result_cache
+    from auth import hashing, user_cache
+    stats = {
+        "clip": None, "text_cache": None, "search_cache": None, "image_metadata_cache": None,
+        "user_cache": None, "password_hashing": None, "search_history": None, "ingestion": None
+    }
+    if clip_model.clip_model is not None:
+        stats["clip"] = clip_model.clip_model.batch_stats()
+        stats["text_cache"] = clip_model.clip_model.text_cache.stats()
+    if result_cache.result_cache is not None:
+        stats["search_cache"] = result_cache.result_cache.stats()
+    if metadata_cache.metadata_cache is not None:
+        stats["image_metadata_cache"] = metadata_cache.metadata_cache.stats()
+    if user_cache.user_cache is not None:
+        stats["user_cache"] = user_cache.user_cache.stats()
+    if hashing.password_hasher is not None:
+        stats["password_hashing"] = hashing.password_hasher.stats()
+    if history_writer.history_writer is not None:
+        stats["search_history"] = history_writer.history_writer.stats()
+    if ingestion.ingestion_pipeline is not None:
+        stats["ingestion"] = ingestion.ingestion_pipeline.stats()
+    return stats
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
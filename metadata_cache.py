@@ -0,0 +1,65 @@
+from collections import OrderedDict, namedtuple
+import os
+import threading
+
+# Images whose search-result fields stay in memory; an entry is a few hundred bytes
+MAX_ENTRIES = int(os.getenv("IMAGE_METADATA_CACHE_SIZE", "10000"))
+
+# The Image columns a search result needs
+ImageMetadata = namedtuple("ImageMetadata", ["id", "user_id", "filename", "filepath"])
+
+class ImageMetadataCache:
+    """
+    LRU cache of image id -> ImageMetadata, so repeated search hits are
+    hydrated without touching the database. Entries must be invalidated
+    when an image is updated or deleted.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_many(self, image_ids) -> dict:
+        """{image_id: ImageMetadata} for the cached subset of `image_ids`"""
+        found = {}
+        with self.lock:
+            for image_id in image_ids:
+                metadata = self.entries.get(image_id)
+                if metadata is None:
+                    self.misses += 1
+                    continue
+                self.entries.move_to_end(image_id)
+                found[image_id] = metadata
+                self.hits += 1
+        return found
+
+    def put_many(self, entries):
+        with self.lock:
+            for metadata in entries:
+                self.entries[metadata.id] = metadata
+                self.entries.move_to_end(metadata.id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, image_id: int):
+        with self.lock:
+            self.entries.pop(image_id, None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+# Global image metadata cache instance
+metadata_cache = None
+metadata_cache_lock = threading.Lock()
+
+def get_metadata_cache():
+    global metadata_cache
+    if metadata_cache is None:
+        with metadata_cache_lock:
+            if metadata_cache is None:
+                metadata_cache = ImageMetadataCache()
+    return metadata_cache
@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Components that must be loaded before /health/ready reports ready
+READY_COMPONENTS = [name.strip() for name in os.getenv("READY_COMPONENTS", "clip,faiss").split(",") if name.strip()]
+
+STATE_PENDING = "pending"
+STATE_LOADING = "loading"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+def load_clip():
+    from ml.clip_model import get_clip_model
+    get_clip_model()
+
+def load_faiss():
+    from ml.faiss_index import get_faiss_index
+    from database import SessionLocal
+    from services.search_service import backfill_index_owners
+    get_faiss_index()
+    db = SessionLocal()
+    try:
+        backfill_index_owners(db)
+    finally:
+        db.close()
+
+def load_classifier():
+    from ml.classifier import get_classifier
+    get_classifier()
+
+COMPONENTS = {"clip": load_clip, "faiss": load_faiss, "classifier": load_classifier}
+
+class ModelLoader:
+    """
+    Loads the ML components in parallel on background threads, so the server
+    accepts requests (and answers liveness probes) while they load. Heavy
+    libraries are only imported by the loaders. Each component's state and
+    load time is reported by status().
+    """
+
+    def __init__(self, components: dict = COMPONENTS, required: list = READY_COMPONENTS):
+        self.components = components
+        self.required = required
+        self.lock = threading.Lock()
+        self.component_state = {
+            name: {"state": STATE_PENDING, "seconds": None, "error": None}
+            for name in components
+        }
+        self.started_at = None
+        self.executor = None
+        self.futures = []
+
+    def start(self):
+        """Begin loading every component; returns immediately"""
+        if self.executor is not None:
+            return
+        self.started_at = time.monotonic()
+        self.executor = ThreadPoolExecutor(max_workers=len(self.components), thread_name_prefix="model-load")
+        self.futures = [self.executor.submit(self._load, name, load) for name, load in self.components.items()]
+
+    def _load(self, name: str, load):
+        with self.lock:
+            self.component_state[name]["state"] = STATE_LOADING
+        start = time.monotonic()
+        try:
+            load()
+            state, error = STATE_READY, None
+            logger.info(f"Loaded {name} in {time.monotonic() - start:.1f}s")
+        except Exception as e:
+            state, error = STATE_FAILED, str(e)
+            logger.error(f"Error loading {name}: {e}")
+        with self.lock:
+            self.component_state[name].update(state=state, seconds=round(time.monotonic() - start, 3), error=error)
+
+    def wait(self, timeout: float = None):
+        """Block until every component has finished loading or failed"""
+        wait(self.futures, timeout=timeout)
+
+    def is_ready(self) -> bool:
+        with self.lock:
+            return all(self.component_state[name]["state"] == STATE_READY for name in self.required if name in self.component_state)
+
+    def status(self) -> dict:
+        with self.lock:
+            components = {name: dict(state) for name, state in self.component_state.items()}
+        uptime = None if self.started_at is None else round(time.monotonic() - self.started_at, 3)
+        return {"ready": self.is_ready(), "uptime_seconds": uptime, "components": components}
+
+    def shutdown(self):
+        """Drop loads that have not started; ones in progress finish in the background"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+# Global model loader instance
+model_loader = None
+
+def get_model_loader():
+    global model_loader
+    if model_loader is None:
+        model_loader = ModelLoader()
+    return model_loader
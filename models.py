@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -25,6 +25,11 @@ class Image(Base):
     classification = Column(String, nullable=True)
     confidence = Column(Float, nullable=True)
     embedding_path = Column(String, nullable=True)
+    content_hash = Column(String(64), index=True, nullable=True)  # SHA-256 of the file bytes
+    # pending until an ingestion worker claims it (processing), then indexed or failed
+    status = Column(String(16), index=True, nullable=False, default="pending", server_default="indexed")
+    status_detail = Column(Text, nullable=True)  # Error message when failed
+    claimed_at = Column(DateTime(timezone=True), nullable=True)  # When processing started
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
     
     owner = relationship("User", back_populates="images")
@@ -39,3 +44,6 @@ class SearchHistory(Base):
     searched_at = Column(DateTime(timezone=True), server_default=func.now())
     
     user = relationship("User", back_populates="searches")
+    
+    # Serves a user's history newest first, and keyset pagination through it
+    __table_args__ = (Index("ix_search_history_user_searched_at", "user_id", "searched_at"),)
@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Smallest side both CLIP ViT-B/32 and MobileNetV2 consume
+MODEL_INPUT_SIZE = 224
+# Threads decoding images ahead of inference
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(os.cpu_count() or 4)))
+
+def load_image(source):
+    """
+    Decode an image path or file object to RGB. JPEGs are decoded at the
+    smallest DCT scale that still covers the model input size, which skips
+    most of the work of a full-resolution decode.
+    """
+    image = Image.open(source)
+    image.draft("RGB", (MODEL_INPUT_SIZE, MODEL_INPUT_SIZE))
+    return image.convert("RGB")
+
+class Preprocessor:
+    """
+    Decodes each image once and derives every model input from that buffer.
+    `transforms` maps an input name to a callable taking the decoded PIL image,
+    e.g. {"clip": clip_model.preprocess, "classifier": classifier.to_input}.
+    """
+
+    def __init__(self, workers: int = PREPROCESS_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preprocess")
+
+    def prepare(self, source, transforms: dict) -> dict:
+        """Decode `source` in the calling thread and return {name: model input}"""
+        image = load_image(source)
+        return {name: transform(image) for name, transform in transforms.items()}
+
+    def submit(self, source, transforms: dict):
+        """Decode on the pool so it overlaps with inference; the Future resolves to prepare()'s result"""
+        return self.executor.submit(self.prepare, source, transforms)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+# Global preprocessor instance
+preprocessor = None
+preprocessor_lock = threading.Lock()
+
+def get_preprocessor():
+    global preprocessor
+    if preprocessor is None:
+        with preprocessor_lock:
+            if preprocessor is None:
+                preprocessor = Preprocessor()
+    return preprocessor
@@ -0,0 +1,103 @@
+"""
+Rebuild the FAISS index from the embedding store, without running CLIP.
+
+    python rebuild_index.py
+    python rebuild_index.py --factory "IVF{nlist},PQ64" --storage mmap
+
+Use it when the index files are lost or to switch index types right away
+instead of waiting for a background migration. Images that have no stored
+embedding yet (indexed before the store existed) are first copied from the
+current index when it still holds them. Failed and deleted images are left out.
+Exits 1 if indexed images are still without an embedding; images being
+ingested are only reported, their vectors reach the new index as they finish.
+"""
+import argparse
+import logging
+import sys
+import time
+
+import numpy as np
+
+from database import SessionLocal, Base, engine, migrate_schema
+from models import Image
+from services.ingestion import STATUS_FAILED, STATUS_INDEXED
+from ml.embedding_store import get_embedding_store
+from ml.faiss_index import FAISSIndex, INDEX_FACTORY, STORAGE_MODE
+
+def image_owners(db) -> dict:
+    """image_id -> user_id of every image that belongs in the index"""
+    return dict(db.query(Image.id, Image.user_id).filter(Image.status != STATUS_FAILED).all())
+
+def indexed_image_ids(db) -> set:
+    """Ids of images whose ingestion finished, as opposed to pending or in progress"""
+    return {image_id for (image_id,) in db.query(Image.id).filter(Image.status == STATUS_INDEXED)}
+
+def backfill_store(db, faiss_index: FAISSIndex, store, owners: dict) -> tuple[int, list]:
+    """
+    Copy vectors of images missing from the store out of the current index
+    Returns: (copied, ids still missing)
+    """
+    stored, _ = store.read_all()
+    missing = sorted(set(owners) - set(stored.tolist()))
+    copied = set()
+    for start in range(0, len(missing), 500):
+        image_ids, vectors = [], []
+        for image_id in missing[start:start + 500]:
+            vector = faiss_index.get_vector(image_id)
+            if vector is not None:
+                image_ids.append(image_id)
+                vectors.append(vector)
+        if not image_ids:
+            continue
+        for image_id, locator in zip(image_ids, store.append(image_ids, np.stack(vectors))):
+            db.query(Image).filter(Image.id == image_id).update({"embedding_path": locator}, synchronize_session=False)
+        db.commit()
+        copied.update(image_ids)
+    return len(copied), [image_id for image_id in missing if image_id not in copied]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Rebuild the FAISS index from stored embeddings")
+    parser.add_argument("--factory", default=INDEX_FACTORY, help="faiss.index_factory string, e.g. Flat, HNSW32, IVF{nlist},PQ64")
+    parser.add_argument("--storage", default=STORAGE_MODE, choices=["memory", "mmap"])
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    Base.metadata.create_all(bind=engine)
+    migrate_schema()
+
+    db = SessionLocal()
+    # Not loaded up front: the checkpoint is only read if the store needs backfilling
+    faiss_index = FAISSIndex(storage=args.storage, index_factory=args.factory, load=False)
+    store = get_embedding_store()
+    try:
+        copied, missing_ids = backfill_store(db, faiss_index, store, image_owners(db))
+        indexed = indexed_image_ids(db)
+        missing = sum(1 for image_id in missing_ids if image_id in indexed)
+        in_flight = len(missing_ids) - missing
+        if copied:
+            print(f"Copied {copied} embeddings from the current index into the store")
+
+        def load_vectors():
+            # Read after the WAL rotates, so images indexed from now on are replayed instead
+            owners = image_owners(db)
+            ids, vectors = store.read_all()
+            keep = np.isin(ids, np.fromiter(owners, dtype=np.int64, count=len(owners)))
+            ids, vectors = ids[keep], vectors[keep]
+            return ids, vectors, [owners[image_id] for image_id in ids.tolist()]
+
+        start = time.perf_counter()
+        count = faiss_index.rebuild(load_vectors)
+        print(f"Rebuilt {args.factory} index with {count} vectors in {time.perf_counter() - start:.1f}s")
+        if missing:
+            print(f"{missing} images have no stored embedding and must be re-ingested", file=sys.stderr)
+        if in_flight:
+            print(f"{in_flight} images are still being ingested and will be added as they finish")
+    finally:
+        db.close()
+        faiss_index.close()
+        store.close()
+
+    return 1 if missing else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+from collections import OrderedDict
+import os
+import threading
+
+# Distinct (user, query, top_k, search params) responses kept in memory
+MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_SIZE", "10000"))
+
+class SearchResultCache:
+    """
+    LRU cache of hydrated search results. Each entry records the FAISS index
+    version it was computed against, so any add or removal, by this worker
+    or another, turns every older entry into a miss.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (index version, results)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple, version: int):
+        """Cached results for `key` computed at index `version`, or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, version: int, results: list):
+        with self.lock:
+            self.entries[key] = (version, results)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+# Global search result cache instance
+result_cache = None
+result_cache_lock = threading.Lock()
+
+def get_result_cache():
+    global result_cache
+    if result_cache is None:
+        with result_cache_lock:
+            if result_cache is None:
+                result_cache = SearchResultCache()
+    return result_cache
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
 from typing import Optional, List
 
@@ -35,16 +35,42 @@ class ImageResponse(BaseModel):
     filepath: str
     classification: Optional[str] = None
     confidence: Optional[float] = None
+    status: Optional[str] = None
     uploaded_at: datetime
     
     class Config:
         from_attributes = True
 
+class ImageStatusResponse(BaseModel):
+    image_id: int
+    status: str
+    detail: Optional[str] = None
+    classification: Optional[str] = None
+    confidence: Optional[float] = None
+
+class BulkUploadFailure(BaseModel):
+    filename: str
+    error: str
+
+class BulkUploadResponse(BaseModel):
+    total: int
+    uploaded: int
+    image_ids: List[int]
+    failed: List[BulkUploadFailure]
+
 class ClassificationResponse(BaseModel):
     image_id: int
     classification: str
     confidence: float
 
+class ClassificationBatchRequest(BaseModel):
+    image_ids: List[int] = Field(..., min_length=1, max_length=500)
+
+class ClassificationBatchResponse(BaseModel):
+    results: List[ClassificationResponse]
+    not_found: List[int]
+    failed: List[int]
+
 # Search Schemas
 class SearchResult(BaseModel):
     image_id: int
@@ -57,6 +83,20 @@ class SearchResponse(BaseModel):
     results: List[SearchResult]
     total_results: int
 
+class SearchBatchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=100)
+    top_k: int = Field(5, ge=1, le=20)
+    nprobe: Optional[int] = Field(None, ge=1, le=4096)
+    ef_search: Optional[int] = Field(None, ge=1, le=4096)
+
+class SearchBatchResponse(BaseModel):
+    results: List[SearchResponse]  # In request order
+
+class SimilarSearchResponse(BaseModel):
+    image_id: Optional[int] = None  # None when the query image was uploaded
+    results: List[SearchResult]
+    total_results: int
+
 # History Schemas
 class SearchHistoryItem(BaseModel):
     id: int
@@ -1,13 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+import io
 import logging
 
 from database import get_db
-from models import User, SearchHistory
-from schemas import SearchResponse, SearchResult
-from auth.jwt import get_current_user
-from services.search_service import search_images
+from models import Image
+from schemas import SearchResponse, SearchResult, SearchBatchRequest, SearchBatchResponse, SimilarSearchResponse
+from auth.jwt import get_current_user_id
+from services.search_service import search_images, search_images_batch, find_similar_images, search_by_image
+from services.history_writer import get_history_writer
 
 logger = logging.getLogger(__name__)
 
@@ -17,13 +19,15 @@ router = APIRouter(prefix="/api", tags=["search"])
 def search_images_by_text(
     q: str = Query(..., description="Search query text"),
     top_k: int = Query(5, ge=1, le=20, description="Number of results to return"),
-    current_user: User = Depends(get_current_user),
+    nprobe: Optional[int] = Query(None, ge=1, le=4096, description="IVF lists to scan (recall vs latency)"),
+    ef_search: Optional[int] = Query(None, ge=1, le=4096, description="HNSW search depth (recall vs latency)"),
+    current_user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """Perform semantic text-to-image search"""
     try:
         # Perform search
-        results = search_images(q, top_k, current_user.id, db)
+        results = search_images(q, top_k, current_user_id, db, nprobe=nprobe, ef_search=ef_search)
         
         # Build response
         search_results = [
@@ -36,14 +40,8 @@ def search_images_by_text(
             for image, similarity in results
         ]
         
-        # Save search history
-        search_history = SearchHistory(
-            user_id=current_user.id,
-            query_text=q,
-            results_count=len(search_results)
-        )
-        db.add(search_history)
-        db.commit()
+        # Save search history; written in bulk off the request path
+        get_history_writer().record(current_user_id, q, len(search_results))
         
         return SearchResponse(
             query=q,
@@ -58,3 +56,138 @@ def search_images_by_text(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error searching images: {str(e)}"
         )
+
+@router.post("/search/batch", response_model=SearchBatchResponse)
+def search_images_by_texts(
+    request: SearchBatchRequest,
+    current_user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    Run many text searches in one request, e.g. one per dashboard tile.
+    Batch queries are not recorded in search history.
+    """
+    try:
+        results = search_images_batch(
+            request.queries, request.top_k, current_user_id, db,
+            nprobe=request.nprobe, ef_search=request.ef_search
+        )
+        
+        responses = []
+        for query, hits in zip(request.queries, results):
+            search_results = [
+                SearchResult(
+                    image_id=image.id,
+                    filename=image.filename,
+                    filepath=image.filepath,
+                    similarity_score=similarity
+                )
+                for image, similarity in hits
+            ]
+            responses.append(SearchResponse(query=query, results=search_results, total_results=len(search_results)))
+        
+        return SearchBatchResponse(results=responses)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error searching images in batch: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error searching images: {str(e)}"
+        )
+
+@router.get("/search/similar", response_model=SimilarSearchResponse)
+def search_similar_images(
+    image_id: int = Query(..., description="Find images like this one"),
+    top_k: int = Query(5, ge=1, le=20, description="Number of results to return"),
+    nprobe: Optional[int] = Query(None, ge=1, le=4096, description="IVF lists to scan (recall vs latency)"),
+    ef_search: Optional[int] = Query(None, ge=1, le=4096, description="HNSW search depth (recall vs latency)"),
+    current_user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """Find images similar to one already uploaded, using its indexed embedding"""
+    try:
+        image = db.query(Image.id, Image.status, Image.embedding_path).filter(
+            Image.id == image_id,
+            Image.user_id == current_user_id
+        ).first()
+        
+        if not image:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Image not found"
+            )
+        
+        results = find_similar_images(
+            image_id, top_k, current_user_id, db,
+            nprobe=nprobe, ef_search=ef_search, embedding_path=image.embedding_path
+        )
+        if results is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Image is not indexed (status: {image.status})"
+            )
+        
+        return similar_response(results, image_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error searching similar images: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error searching similar images: {str(e)}"
+        )
+
+@router.post("/search/similar", response_model=SimilarSearchResponse)
+def search_similar_to_upload(
+    file: UploadFile = File(...),
+    top_k: int = Query(5, ge=1, le=20, description="Number of results to return"),
+    nprobe: Optional[int] = Query(None, ge=1, le=4096, description="IVF lists to scan (recall vs latency)"),
+    ef_search: Optional[int] = Query(None, ge=1, le=4096, description="HNSW search depth (recall vs latency)"),
+    current_user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """Find images similar to an uploaded image; the upload is only encoded, never stored"""
+    try:
+        if not file.content_type or not file.content_type.startswith('image/'):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="File must be an image"
+            )
+        
+        try:
+            results = search_by_image(
+                io.BytesIO(file.file.read()), top_k, current_user_id, db, nprobe=nprobe, ef_search=ef_search
+            )
+        except OSError as e:
+            # PIL could not decode the upload
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Could not read image: {e}"
+            )
+        
+        return similar_response(results)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error searching by image: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error searching by image: {str(e)}"
+        )
+
+def similar_response(results: list, image_id: int = None) -> SimilarSearchResponse:
+    search_results = [
+        SearchResult(
+            image_id=image.id,
+            filename=image.filename,
+            filepath=image.filepath,
+            similarity_score=similarity
+        )
+        for image, similarity in results
+    ]
+    return SimilarSearchResponse(
+        image_id=image_id,
+        results=search_results,
+        total_results=len(search_results)
+    )
@@ -4,54 +4,258 @@ import numpy as np
 import logging
 
 from models import Image
-from ml.clip_model import get_clip_model
-from ml.faiss_index import get_faiss_index
+from services.metadata_cache import ImageMetadata, get_metadata_cache
+from services.result_cache import get_result_cache
+from ml.embedding_cache import normalize_query
 
 logger = logging.getLogger(__name__)
 
-def add_image_to_search_index(image_id: int, image_path: str, db: Session):
-    """Generate CLIP embedding and add to FAISS index"""
+def add_image_to_search_index(
+    image_id: int,
+    image_path: str,
+    db: Session,
+    user_id: int = None,
+    embedding: np.ndarray = None
+):
+    """
+    Generate CLIP embedding (unless one is given), persist it to the embedding
+    store and add it to the FAISS index. Sets Image.embedding_path; the caller commits.
+    """
+    from ml.clip_model import get_clip_model
+    from ml.embedding_store import get_embedding_store
+    from ml.faiss_index import get_faiss_index
     try:
-        clip_model = get_clip_model()
         faiss_index = get_faiss_index()
         
+        if user_id is None:
+            user_id = db.query(Image.user_id).filter(Image.id == image_id).scalar()
+            if user_id is None:
+                raise ValueError(f"Image {image_id} does not exist")
+        
         # Generate embedding
-        embedding = clip_model.encode_image(image_path)
+        if embedding is None:
+            embedding = get_clip_model().encode_image(image_path)
+        
+        # Persist first, so a rebuilt index never needs CLIP for this image
+        locator = get_embedding_store().append([image_id], embedding)[0]
+        db.query(Image).filter(Image.id == image_id).update({"embedding_path": locator}, synchronize_session=False)
         
         # Add to FAISS index
-        faiss_index.add_vector(embedding, image_id)
+        faiss_index.add_vector(embedding, image_id, user_id)
+        get_metadata_cache().invalidate(image_id)
         
         logger.info(f"Added image {image_id} to search index")
     except Exception as e:
         logger.error(f"Error adding image to search index: {e}")
         raise
 
-def search_images(query_text: str, top_k: int, user_id: int, db: Session) -> list:
+def get_image_embedding(image_id: int, embedding_path: str = None):
+    """Embedding already computed for an image, from the index or else the embedding store, or None"""
+    from ml.embedding_store import get_embedding_store
+    from ml.faiss_index import get_faiss_index
+    embedding = get_faiss_index().get_vector(image_id)
+    if embedding is None and embedding_path:
+        embedding = get_embedding_store().get(embedding_path)
+    return embedding
+
+def remove_image_from_search_index(image_id: int):
+    """Delete an image's embedding from the FAISS index"""
+    from ml.faiss_index import get_faiss_index
+    try:
+        faiss_index = get_faiss_index()
+        get_metadata_cache().invalidate(image_id)
+        if faiss_index.remove_vector(image_id):
+            logger.info(f"Removed image {image_id} from search index")
+    except Exception as e:
+        logger.error(f"Error removing image from search index: {e}")
+        raise
+
+def backfill_index_owners(db: Session):
+    """
+    Tag vectors indexed before owners were tracked with their image's user_id,
+    and remove those whose image no longer exists. Rewrites the whole index,
+    so it runs once while the index loads, never from a request.
+    """
+    from ml.faiss_index import get_faiss_index
+    faiss_index = get_faiss_index()
+    if not faiss_index.needs_owners:
+        return
+
+    image_ids = faiss_index.unowned_image_ids()
+    owners = {}
+    for start in range(0, len(image_ids), 500):
+        chunk = image_ids[start:start + 500]
+        owners.update(db.query(Image.id, Image.user_id).filter(Image.id.in_(chunk)).all())
+    # Orphans would otherwise stay unowned and be retried on every start
+    orphans = [image_id for image_id in image_ids if image_id not in owners]
+    for image_id in orphans:
+        faiss_index.remove_vector(image_id)
+    if owners:
+        faiss_index.assign_owners(owners)
+    logger.info(
+        f"Assigned owners to {len(owners)} of {len(image_ids)} unowned index vectors, "
+        f"removed {len(orphans)} without an image"
+    )
+
+def search_images(
+    query_text: str,
+    top_k: int,
+    user_id: int,
+    db: Session,
+    nprobe: int = None,
+    ef_search: int = None
+) -> list:
     """
     Perform semantic search
-    Returns list of (image, similarity_score) tuples
+    Returns list of (ImageMetadata, similarity_score) tuples
     """
+    from ml.clip_model import get_clip_model
+    from ml.faiss_index import get_faiss_index
     try:
-        clip_model = get_clip_model()
         faiss_index = get_faiss_index()
         
-        # Encode query text
-        query_embedding = clip_model.encode_text(query_text)
+        # Identical searches are answered from cache until the index changes
+        result_cache = get_result_cache()
+        key = (user_id, normalize_query(query_text), top_k, nprobe, ef_search)
+        version = faiss_index.current_version()
+        cached = result_cache.get(key, version)
+        if cached is not None:
+            return cached
         
-        # Search FAISS index
-        results = faiss_index.search(query_embedding, top_k)
+        # Encode query text
+        query_embedding = get_clip_model().encode_text(query_text)
         
-        # Filter results to user's images and fetch image details
-        search_results = []
-        for image_id, similarity in results:
-            image = db.query(Image).filter(
-                Image.id == image_id,
-                Image.user_id == user_id
-            ).first()
-            if image:
-                search_results.append((image, similarity))
+        # Search only this user's vectors in the FAISS index
+        results = faiss_index.search(query_embedding, top_k, nprobe=nprobe, ef_search=ef_search, user_id=user_id)
         
+        search_results = hydrate_results(results, user_id, db)
+        result_cache.put(key, version, search_results)
         return search_results
     except Exception as e:
         logger.error(f"Error searching images: {e}")
         raise
+
+def search_images_batch(
+    query_texts: list[str],
+    top_k: int,
+    user_id: int,
+    db: Session,
+    nprobe: int = None,
+    ef_search: int = None
+) -> list:
+    """
+    Semantic search for many queries at once: one CLIP forward pass, one
+    FAISS search call and one metadata query for all queries not already cached
+    Returns one list of (ImageMetadata, similarity_score) tuples per query
+    """
+    from ml.clip_model import get_clip_model
+    from ml.faiss_index import get_faiss_index
+    try:
+        faiss_index = get_faiss_index()
+        
+        result_cache = get_result_cache()
+        version = faiss_index.current_version()
+        keys = [(user_id, normalize_query(text), top_k, nprobe, ef_search) for text in query_texts]
+        answers = {}
+        for key in keys:
+            if key not in answers:
+                answers[key] = result_cache.get(key, version)
+        
+        # Queries that normalize to the same text are searched once
+        pending = {}
+        for key, text in zip(keys, query_texts):
+            if answers[key] is None:
+                pending.setdefault(key, text)
+        if pending:
+            embeddings = get_clip_model().encode_texts(list(pending.values()), use_cache=True)
+            results = faiss_index.search_batch(embeddings, top_k, nprobe=nprobe, ef_search=ef_search, user_id=user_id)
+            images = load_metadata({image_id for hits in results for image_id, _ in hits}, db)
+            for key, hits in zip(pending, results):
+                answers[key] = owned_results(hits, images, user_id)
+                result_cache.put(key, version, answers[key])
+        
+        return [answers[key] for key in keys]
+    except Exception as e:
+        logger.error(f"Error searching images in batch: {e}")
+        raise
+
+def find_similar_images(
+    image_id: int,
+    top_k: int,
+    user_id: int,
+    db: Session,
+    nprobe: int = None,
+    ef_search: int = None,
+    embedding_path: str = None
+):
+    """
+    Images most like an indexed image, searched with its stored vector and no model inference.
+    The vector comes from the index, or from the embedding store at `embedding_path`.
+    Returns list of (ImageMetadata, similarity_score) tuples, or None if it has no stored vector
+    """
+    from ml.faiss_index import get_faiss_index
+    try:
+        faiss_index = get_faiss_index()
+        embedding = get_image_embedding(image_id, embedding_path)
+        if embedding is None:
+            return None
+        
+        # One extra hit, since the image itself is its own best match
+        results = faiss_index.search(embedding, top_k + 1, nprobe=nprobe, ef_search=ef_search, user_id=user_id)
+        results = [(hit_id, similarity) for hit_id, similarity in results if hit_id != image_id][:top_k]
+        return hydrate_results(results, user_id, db)
+    except Exception as e:
+        logger.error(f"Error searching images similar to {image_id}: {e}")
+        raise
+
+def search_by_image(
+    image_source,
+    top_k: int,
+    user_id: int,
+    db: Session,
+    nprobe: int = None,
+    ef_search: int = None
+) -> list:
+    """
+    Images most like an image that is encoded for the query but never stored
+    Returns list of (ImageMetadata, similarity_score) tuples
+    """
+    from ml.clip_model import get_clip_model
+    from ml.faiss_index import get_faiss_index
+    try:
+        faiss_index = get_faiss_index()
+        
+        embedding = get_clip_model().encode_image(image_source)
+        results = faiss_index.search(embedding, top_k, nprobe=nprobe, ef_search=ef_search, user_id=user_id)
+        return hydrate_results(results, user_id, db)
+    except Exception as e:
+        logger.error(f"Error searching images by example: {e}")
+        raise
+
+def hydrate_results(results: list, user_id: int, db: Session) -> list:
+    """
+    (ImageMetadata, similarity) for (image_id, similarity) hits owned by `user_id`,
+    in rank order. Cached images cost nothing; the rest are fetched in one query.
+    """
+    images = load_metadata([image_id for image_id, _ in results], db)
+    return owned_results(results, images, user_id)
+
+def owned_results(results: list, images: dict, user_id: int) -> list:
+    """Pair hits with their metadata, dropping images that are gone or not `user_id`'s"""
+    return [
+        (images[image_id], similarity)
+        for image_id, similarity in results
+        if image_id in images and images[image_id].user_id == user_id
+    ]
+
+def load_metadata(image_ids, db: Session) -> dict:
+    """{image_id: ImageMetadata}, from the cache where possible and one query for the rest"""
+    cache = get_metadata_cache()
+    images = cache.get_many(image_ids)
+    missing = [image_id for image_id in image_ids if image_id not in images]
+    if missing:
+        rows = db.query(Image.id, Image.user_id, Image.filename, Image.filepath).filter(Image.id.in_(missing))
+        fetched = [ImageMetadata(*row) for row in rows]
+        cache.put_many(fetched)
+        images.update((metadata.id, metadata) for metadata in fetched)
+    return images
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from ml.batcher import MicroBatcher
+
+class FakeEncoder:
+    """Encode function doubling each item, recording the batches it was called with"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, items: list) -> list:
+        self.release.wait()
+        self.batches.append(list(items))
+        if self.fail:
+            raise RuntimeError("encoder failed")
+        return [item * 2 for item in items]
+
+@pytest.fixture
+def make_batcher():
+    batchers = []
+
+    def make(fn, **kwargs):
+        batcher = MicroBatcher(fn, **kwargs)
+        batchers.append(batcher)
+        return batcher
+
+    yield make
+    for batcher in batchers:
+        batcher.close()
+
+def test_concurrent_items_share_a_batch(make_batcher):
+    encoder = FakeEncoder()
+    batcher = make_batcher(encoder, max_batch_size=4, max_wait_ms=1000)
+    futures = [batcher.submit(i) for i in range(8)]
+
+    assert [future.result(timeout=5) for future in futures] == [i * 2 for i in range(8)]
+    assert encoder.batches == [[0, 1, 2, 3], [4, 5, 6, 7]]
+    stats = batcher.stats()
+    assert stats["batches"] == 2 and stats["items"] == 8
+    assert stats["batch_sizes"] == {4: 2}
+
+def test_partial_batch_runs_after_max_wait(make_batcher):
+    encoder = FakeEncoder()
+    batcher = make_batcher(encoder, max_batch_size=16, max_wait_ms=20)
+    start = time.monotonic()
+
+    assert batcher(3) == 6
+    assert time.monotonic() - start < 1
+    assert encoder.batches == [[3]]
+
+def test_items_queued_while_busy_form_the_next_batch(make_batcher):
+    encoder = FakeEncoder()
+    encoder.release.clear()
+    batcher = make_batcher(encoder, max_batch_size=16, max_wait_ms=0)
+    first = batcher.submit(0)
+    time.sleep(0.05)  # The worker is now blocked encoding the first batch
+    rest = [batcher.submit(i) for i in range(1, 4)]
+    encoder.release.set()
+
+    assert first.result(timeout=5) == 0
+    assert [future.result(timeout=5) for future in rest] == [2, 4, 6]
+    assert encoder.batches == [[0], [1, 2, 3]]
+
+def test_errors_reach_every_caller_in_the_batch(make_batcher):
+    encoder = FakeEncoder(fail=True)
+    batcher = make_batcher(encoder, max_batch_size=2, max_wait_ms=1000)
+    futures = [batcher.submit(i) for i in range(2)]
+
+    for future in futures:
+        with pytest.raises(RuntimeError, match="encoder failed"):
+            future.result(timeout=5)
+
+    # The worker keeps serving later calls
+    encoder.fail = False
+    assert batcher(5) == 10
+
+def test_rejects_empty_batches():
+    with pytest.raises(ValueError):
+        MicroBatcher(FakeEncoder(), max_batch_size=0)
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from ml import embedding_cache
+from ml.embedding_cache import EmbeddingCache
+
+class Clock:
+    """Stands in for the time module so TTLs expire without sleeping"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(embedding_cache, "time", clock)
+    return clock
+
+def embedding(value: float) -> np.ndarray:
+    return np.full(4, value, dtype=np.float32)
+
+def test_equivalent_queries_share_an_entry(clock):
+    cache = EmbeddingCache("clip", disk_path="")
+    cache.put("A  Dog", embedding(1))
+
+    assert np.array_equal(cache.get("a dog"), embedding(1))
+    assert cache.get("a cat") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+def test_least_recently_used_entry_is_evicted(clock):
+    # Room for two entries: 16 bytes of float32 plus the one-letter key each
+    cache = EmbeddingCache("clip", max_bytes=34, disk_path="")
+    cache.put("a", embedding(1))
+    cache.put("b", embedding(2))
+    cache.get("a")
+    cache.put("c", embedding(3))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["bytes"] == 34
+
+def test_entries_expire_after_ttl(clock):
+    cache = EmbeddingCache("clip", ttl=60, disk_path="")
+    cache.put("a dog", embedding(1))
+
+    clock.now += 59
+    assert cache.get("a dog") is not None
+    clock.now += 1
+    assert cache.get("a dog") is None
+    assert cache.stats()["entries"] == 0
+
+def test_disk_tier_is_shared_and_survives_restarts(clock, tmp_path):
+    path = str(tmp_path / "cache" / "text.db")
+    first = EmbeddingCache("clip", disk_path=path)
+    first.put("a dog", embedding(1))
+    first.close()
+
+    second = EmbeddingCache("clip", disk_path=path)
+    assert np.array_equal(second.get("a dog"), embedding(1))
+    assert second.get("a dog") is not None  # Now served from memory
+    stats = second.stats()
+    assert (stats["disk_hits"], stats["hits"]) == (1, 1)
+    # Another model never sees these vectors
+    assert EmbeddingCache("siglip", disk_path=path).get("a dog") is None
+
+def test_disk_tier_respects_ttl(clock, tmp_path):
+    path = str(tmp_path / "text.db")
+    EmbeddingCache("clip", ttl=60, disk_path=path).put("a dog", embedding(1))
+
+    clock.now += 60
+    assert EmbeddingCache("clip", ttl=60, disk_path=path).get("a dog") is None
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from ml.embedding_store import EmbeddingStore
+
+DIMENSION = 8
+
+@pytest.fixture
+def store(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dimension=DIMENSION, chunk_rows=4, fsync=False)
+    yield store
+    store.close()
+
+def vectors(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, DIMENSION)).astype('float32')
+
+def test_get_reads_open_and_sealed_chunks(store):
+    embeddings = vectors(6)
+    locators = store.append([1, 2, 3], embeddings[:3])
+    assert locators == ["00000001:0", "00000001:1", "00000001:2"]
+    assert np.allclose(store.get(locators[1]), embeddings[1], atol=1e-2)  # Still open
+
+    locators += store.append([4, 5, 6], embeddings[3:])  # Seals chunk 1 at 4 rows
+    assert locators[3:] == ["00000001:3", "00000001:4", "00000001:5"]
+    assert store.append([7], embeddings[:1]) == ["00000002:0"]
+    for locator, embedding in zip(locators, embeddings):
+        assert np.allclose(store.get(locator), embedding, atol=1e-2)
+
+    assert store.get("00000002:1") is None
+    assert store.get("00000009:0") is None
+    assert store.get(None) is None
+    assert store.get("not a locator") is None
+
+def test_read_all_keeps_latest_row_per_image(store):
+    embeddings = vectors(5)
+    store.append([1, 2, 3, 4], embeddings[:4])
+    store.append([2], embeddings[4:])
+
+    ids, stored = store.read_all()
+    assert ids.tolist() == [1, 3, 4, 2]
+    assert stored.dtype == np.float16
+    assert np.allclose(stored[3], embeddings[4], atol=1e-2)
+
+def test_partial_append_is_dropped(tmp_path, store):
+    embeddings = vectors(3)
+    store.append([1, 2], embeddings[:2])
+    # A crash after writing a vector but before its id
+    with open(tmp_path / "00000001.vectors.open", "ab") as f:
+        f.write(embeddings[2].astype(np.float16).tobytes())
+    assert store.get("00000001:2") is None
+
+    reopened = EmbeddingStore(str(tmp_path), dimension=DIMENSION, chunk_rows=4, fsync=False)
+    assert reopened.append([3], embeddings[2:]) == ["00000001:2"]
+    ids, _ = reopened.read_all()
+    assert ids.tolist() == [1, 2, 3]
+    reopened.close()
@@ -0,0 +1,297 @@
+import pickle
+
+import faiss
+import numpy as np
+import pytest
+
+from ml import faiss_index
+from ml.faiss_index import FAISSIndex
+
+DIMENSION = 16
+
+def unit_vectors(n: int, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((n, DIMENSION)).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+@pytest.fixture
+def make_index(tmp_path, monkeypatch):
+    """FAISSIndex factory sharing one index directory, like uvicorn workers do"""
+    monkeypatch.setenv("FAISS_INDEX_DIR", str(tmp_path / "faiss"))
+    monkeypatch.chdir(tmp_path)  # No legacy ml/faiss_index.pkl to migrate
+    monkeypatch.setattr(faiss_index, "WAL_FSYNC", False)
+    indexes = []
+
+    def make(**kwargs):
+        index = FAISSIndex(dimension=DIMENSION, **kwargs)
+        indexes.append(index)
+        return index
+
+    yield make
+    for index in indexes:
+        index.store.close()
+
+def top_id(index: FAISSIndex, vector: np.ndarray, user_id: int = None) -> int:
+    return index.search(vector, 1, user_id=user_id)[0][0]
+
+@pytest.mark.parametrize("storage", ["memory", "mmap"])
+def test_readd_after_checkpoint_replaces_vector(make_index, storage):
+    vectors = unit_vectors(11)
+    index = make_index(storage=storage)
+    index.add_vectors(vectors[:10], list(range(1, 11)), 7)
+    index.checkpoint(force=True)
+
+    index.add_vectors(vectors[10:], [1], 7)
+    index.checkpoint(force=True)
+
+    assert index.contains(1)
+    assert len(index) == 10
+    assert not index.tombstones
+    assert top_id(index, vectors[10]) == 1
+    assert top_id(index, vectors[10], user_id=7) == 1
+    assert np.allclose(index.get_vector(1), vectors[10], atol=1e-6)
+
+    reloaded = make_index(storage=storage)
+    assert reloaded.contains(1)
+    assert len(reloaded) == 10
+    assert top_id(reloaded, vectors[10], user_id=7) == 1
+
+def test_readd_survives_compaction(make_index, monkeypatch):
+    monkeypatch.setattr(faiss_index, "COMPACT_RATIO", 0.0)
+    vectors = unit_vectors(11)
+    index = make_index()
+    index.add_vectors(vectors[:10], list(range(1, 11)), 7)
+    index.checkpoint(force=True)
+
+    index.add_vectors(vectors[10:], [1], 7)
+    index.remove_vector(2)
+    index.checkpoint(force=True)
+
+    assert index.contains(1) and not index.contains(2)
+    assert len(index) == index.base.ntotal == 9
+    assert top_id(index, vectors[10]) == 1
+
+def test_readd_with_hnsw(make_index):
+    vectors = unit_vectors(11)
+    index = make_index(index_factory="HNSW32")
+    index.add_vectors(vectors[:10], list(range(1, 11)), 7)
+    index.checkpoint(force=True)
+
+    index.add_vectors(vectors[10:], [1], 7)
+    index.checkpoint(force=True)
+
+    assert index.base.ntotal == 10
+    assert top_id(index, vectors[10]) == 1
+
+def test_uncheckpointed_adds_replay_on_reload(make_index):
+    vectors = unit_vectors(5)
+    index = make_index()
+    index.add_vectors(vectors[:3], [1, 2, 3], 7)
+    index.checkpoint(force=True)
+    index.add_vectors(vectors[3:], [4, 5], 7)
+
+    reloaded = make_index()
+    assert len(reloaded) == 5
+    assert reloaded.base.ntotal == 3 and reloaded.index.ntotal == 2
+    assert top_id(reloaded, vectors[4], user_id=7) == 5
+
+@pytest.mark.parametrize("storage", ["memory", "mmap"])
+def test_workers_see_each_others_writes(make_index, storage):
+    vectors = unit_vectors(4)
+    first, second = make_index(storage=storage), make_index(storage=storage)
+    first.add_vectors(vectors[:2], [1, 2], 7)
+    assert top_id(second, vectors[1]) == 2
+
+    second.add_vectors(vectors[2:], [3, 4], 7)
+    second.checkpoint(force=True)
+    first.remove_vector(3)
+    assert top_id(first, vectors[3]) == 4
+    assert second.get_vector(3) is None
+    second.current_version()  # Catch up before reading the size
+    assert len(first) == len(second) == 3
+
+def test_trains_configured_factory_once_enough_vectors(make_index, monkeypatch):
+    monkeypatch.setattr(faiss_index, "TRAIN_MIN", 0)
+    vectors = unit_vectors(700)
+    index = make_index(index_factory="IVF16,Flat")
+    index.add_vectors(vectors[:100], list(range(1, 101)), 7)
+    index.checkpoint(force=True)
+    assert index.base_meta["factory"] == "Flat"  # Too few vectors to train 16 lists
+
+    index.add_vectors(vectors[100:], list(range(101, 701)), 7)
+    index.checkpoint(force=True)
+    assert index.base_meta["factory"] == "IVF16,Flat"
+    assert index.base_meta["trained_on"] == 700
+    assert index.base.ntotal == 700
+    assert top_id(index, vectors[650]) == 651
+
+def test_changed_factory_migrates_on_load(make_index):
+    vectors = unit_vectors(20)
+    index = make_index()
+    index.add_vectors(vectors, list(range(1, 21)), 7)
+    index.checkpoint(force=True)
+
+    migrated = make_index(index_factory="HNSW32")
+    migrated._checkpoint_thread.join()
+    assert migrated.base_meta["spec"] == migrated.base_meta["factory"] == "HNSW32"
+    assert len(migrated) == 20
+    assert top_id(migrated, vectors[5], user_id=7) == 6
+
+@pytest.mark.parametrize("exact_limit", [0, 2048])
+def test_user_search_only_returns_own_vectors(make_index, monkeypatch, exact_limit):
+    # 0 forces the ID-selector path, the default scores small users exactly
+    monkeypatch.setattr(faiss_index, "EXACT_USER_LIMIT", exact_limit)
+    vectors = unit_vectors(20)
+    index = make_index()
+    index.add_vectors(vectors[:10], list(range(1, 11)), 1)
+    index.checkpoint(force=True)
+    index.add_vectors(vectors[10:], list(range(11, 21)), 2)
+
+    for user_id, own in ((1, set(range(1, 11))), (2, set(range(11, 21)))):
+        results = index.search(vectors[0], 5, user_id=user_id)
+        assert len(results) == 5
+        assert {image_id for image_id, _ in results} <= own
+    assert index.search(vectors[0], 5, user_id=3) == []
+    assert top_id(index, vectors[15]) == 16
+
+def test_assign_owners_scopes_legacy_vectors(make_index):
+    vectors = unit_vectors(4)
+    index = make_index()
+    index.add_vectors(vectors, [1, 2, 3, 4])
+    index.checkpoint(force=True)
+    assert index.needs_owners
+    assert sorted(index.unowned_image_ids()) == [1, 2, 3, 4]
+
+    index.remove_vector(4)  # An orphan without an image row
+    index.assign_owners({1: 1, 2: 1, 3: 2})
+    assert not index.needs_owners
+    assert index.unowned_image_ids() == []
+    assert {image_id for image_id, _ in index.search(vectors[2], 3, user_id=1)} == {1, 2}
+
+def test_remove_from_delta_and_base(make_index, monkeypatch):
+    monkeypatch.setattr(faiss_index, "COMPACT_RATIO", 1.0)  # Keep tombstones
+    vectors = unit_vectors(6)
+    index = make_index()
+    index.add_vectors(vectors[:4], [1, 2, 3, 4], 7)
+    index.checkpoint(force=True)
+    index.add_vectors(vectors[4:], [5, 6], 7)
+
+    assert index.remove_vector(5)  # In the delta: gone immediately
+    assert index.remove_vector(2)  # In the base: tombstoned
+    assert not index.remove_vector(2)
+    assert not index.remove_vector(99)
+    assert index.tombstones == {2}
+    assert len(index) == 4
+    for user_id in (None, 7):
+        found = {image_id for image_id, _ in index.search(vectors[1], 6, user_id=user_id)}
+        assert found == {1, 3, 4, 6}
+
+    reloaded = make_index()
+    assert reloaded.tombstones == {2}
+    assert reloaded.get_vector(2) is None and reloaded.get_vector(5) is None
+
+def test_compaction_drops_tombstoned_vectors(make_index, monkeypatch):
+    monkeypatch.setattr(faiss_index, "COMPACT_RATIO", 0.2)
+    vectors = unit_vectors(10)
+    index = make_index()
+    index.add_vectors(vectors, list(range(1, 11)), 7)
+    index.checkpoint(force=True)
+
+    index.remove_vector(1)
+    index.remove_vector(2)
+    index.checkpoint()
+    assert index.base.ntotal == 10  # At the ratio, not over it
+
+    index.remove_vector(3)  # Over the ratio: compacts in the background
+    index._checkpoint_thread.join()
+    assert index.base.ntotal == 7
+    assert not index.tombstones
+    assert sorted(index.base_ids.tolist()) == list(range(4, 11))
+    assert top_id(index, vectors[0], user_id=7) != 1
+
+def test_get_vectors_returns_indexed_ids_only(make_index):
+    vectors = unit_vectors(3)
+    index = make_index()
+    index.add_vectors(vectors[:2], [1, 2], 7)
+    index.checkpoint(force=True)
+    index.add_vectors(vectors[2:], [3], 7)
+    index.remove_vector(1)
+
+    found = index.get_vectors([1, 2, 3, 4])
+    assert sorted(found) == [2, 3]
+    assert np.allclose(found[2], vectors[1], atol=1e-6)
+    assert np.allclose(found[3], vectors[2], atol=1e-6)
+
+def test_version_changes_with_searchable_contents(make_index):
+    vectors = unit_vectors(2)
+    index, other = make_index(), make_index()
+    start = other.current_version()
+
+    index.add_vectors(vectors[:1], [1], 7)
+    after_add = other.current_version()
+    assert after_add > start
+    assert other.current_version() == after_add  # No writes, no change
+
+    index.remove_vector(1)
+    assert other.current_version() > after_add
+
+def test_rebuild_replaces_index_and_keeps_racing_writes(make_index):
+    vectors = unit_vectors(6)
+    index = make_index()
+    index.add_vectors(vectors[:3], [1, 2, 3], 7)
+    index.checkpoint(force=True)
+    writer = make_index()
+
+    def load_vectors():
+        # A write from another worker while the rebuild reads its source
+        writer.add_vectors(vectors[5:], [6], 8)
+        return np.array([4, 2, 5]), vectors[[3, 1, 4]].astype(np.float16), [7, 7, 8]
+
+    rebuilt = make_index(index_factory="HNSW32", load=False)
+    assert rebuilt.rebuild(load_vectors) == 3
+    assert rebuilt.base_meta["factory"] == "HNSW32"
+
+    for worker in (rebuilt, index):
+        assert worker.get_vector(1) is None
+        assert sorted(worker.get_vectors([1, 2, 3, 4, 5, 6])) == [2, 4, 5, 6]
+        assert top_id(worker, vectors[4], user_id=8) == 5
+        assert top_id(worker, vectors[5], user_id=8) == 6
+
+def test_unreadable_legacy_pickle_is_not_replaced(make_index, tmp_path):
+    (tmp_path / "ml").mkdir()
+    (tmp_path / "ml" / "faiss_index.pkl").write_bytes(b"not a pickle")
+
+    with pytest.raises(Exception):
+        make_index()
+    # Nothing was published, so the next start tries the migration again
+    assert not (tmp_path / "faiss" / "CURRENT").exists()
+    with pytest.raises(Exception):
+        make_index()
+
+def test_legacy_pickle_is_migrated(make_index, tmp_path):
+    vectors = unit_vectors(3)
+    legacy = faiss.IndexFlatIP(DIMENSION)
+    legacy.add(vectors)
+    (tmp_path / "ml").mkdir()
+    with open(tmp_path / "ml" / "faiss_index.pkl", "wb") as f:
+        pickle.dump({"index": legacy, "image_ids": [10, 20, 30]}, f)
+
+    index = make_index()
+    assert len(index) == 3
+    assert top_id(index, vectors[1]) == 20
+    assert sorted(index.unowned_image_ids()) == [10, 20, 30]
+
+def test_only_one_worker_migrates_a_changed_factory(make_index):
+    vectors = unit_vectors(20)
+    index = make_index()
+    index.add_vectors(vectors, list(range(1, 21)), 7)
+    index.checkpoint(force=True)
+    generation = index.base_generation
+
+    workers = [make_index(index_factory="HNSW32") for _ in range(3)]
+    for worker in workers:
+        worker._checkpoint_thread.join()
+    assert index.store.current_generation() == generation + 1
+    for worker in workers:
+        worker.current_version()
+        assert worker.base_generation == generation + 1
+        assert worker.base_meta["factory"] == "HNSW32"
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from auth.hashing import PasswordHasher, HasherBusyError, verify_password
+
+@pytest.fixture
+def hasher(monkeypatch):
+    monkeypatch.setenv("BCRYPT_ROUNDS", "4")  # Read by the spawned workers
+    hasher = PasswordHasher(workers=1, max_pending=2)
+    yield hasher
+    hasher.shutdown()
+
+def test_hash_round_trips(hasher):
+    async def run():
+        hashed = await hasher.hash("secret")
+        return hashed, await hasher.verify("secret", hashed), await hasher.verify("wrong", hashed)
+
+    hashed, matches, mismatches = asyncio.run(run())
+    assert matches and not mismatches
+    assert verify_password("secret", hashed)
+    assert hasher.stats()["completed"] == 3
+
+def test_calls_beyond_the_pending_cap_are_rejected(hasher):
+    async def run():
+        queued = [asyncio.create_task(hasher.hash(f"password {i}")) for i in range(2)]
+        await asyncio.sleep(0)  # Both are now waiting on the pool
+        assert hasher.stats()["pending"] == 2
+        with pytest.raises(HasherBusyError):
+            await hasher.hash("one too many")
+        await asyncio.gather(*queued)
+        # Room again once the queued hashes finish
+        return await hasher.hash("after the burst")
+
+    assert asyncio.run(run())
+    stats = hasher.stats()
+    assert (stats["pending"], stats["completed"], stats["rejected"]) == (0, 3, 1)
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, get_async_db
+from models import User, SearchHistory
+from auth.jwt import get_current_user_id
+from routers import history
+
+class StubWriter:
+    """History writer with a fixed answer to has_pending, counting flushes"""
+
+    def __init__(self, pending: bool = False):
+        self.pending = pending
+        self.flushes = 0
+
+    def has_pending(self, user_id: int) -> bool:
+        return self.pending
+
+    def flush(self):
+        self.flushes += 1
+
+@pytest.fixture
+def writer(monkeypatch):
+    writer = StubWriter()
+    monkeypatch.setattr(history, "get_history_writer", lambda: writer)
+    return writer
+
+@pytest.fixture
+def client(tmp_path, writer):
+    path = tmp_path / "history.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    with sessionmaker(bind=engine)() as db:
+        db.add_all([
+            User(id=1, username="alice", email="alice@example.com", hashed_password="x"),
+            User(id=2, username="bob", email="bob@example.com", hashed_password="x"),
+        ])
+        # Seven searches for alice; ids 3 and 4 share a timestamp, so the id breaks the tie
+        for i in range(1, 8):
+            searched_at = start + timedelta(minutes=3 if i == 4 else i)
+            db.add(SearchHistory(id=i, user_id=1, query_text=f"query {i}", results_count=i, searched_at=searched_at))
+        db.add(SearchHistory(id=8, user_id=2, query_text="bob's query", results_count=1, searched_at=start))
+        db.commit()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    async def get_test_db():
+        async with AsyncSession() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(history.router)
+    app.dependency_overrides[get_async_db] = get_test_db
+    app.dependency_overrides[get_current_user_id] = lambda: 1
+    with TestClient(app) as client:
+        yield client
+    engine.dispose()
+
+def test_pages_cover_history_newest_first(client):
+    ids, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": 3}
+        if cursor is not None:
+            params["cursor"] = cursor
+        response = client.get("/api/history/1", params=params)
+        assert response.status_code == 200
+        ids += [item["id"] for item in response.json()]
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        assert cursor == str(ids[-1])
+
+    assert pages == 3
+    assert ids == [7, 6, 5, 4, 3, 2, 1]
+
+def test_exact_last_page_has_no_cursor(client):
+    response = client.get("/api/history/1", params={"limit": 7})
+    assert len(response.json()) == 7
+    assert "X-Next-Cursor" not in response.headers
+
+def test_other_users_history_is_forbidden(client):
+    assert client.get("/api/history/2").status_code == 403
+
+def test_first_page_flushes_pending_searches(client, writer):
+    writer.pending = True
+    client.get("/api/history/1", params={"limit": 3})
+    assert writer.flushes == 1
+
+    client.get("/api/history/1", params={"limit": 3, "cursor": 5})
+    assert writer.flushes == 1
@@ -0,0 +1,101 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+from ml.index_store import IndexStore, OP_ADD, OP_REMOVE, NO_OWNER, WAL_HEADER
+
+DIMENSION = 8
+
+@pytest.fixture
+def store(tmp_path):
+    store = IndexStore(str(tmp_path), DIMENSION, fsync=False)
+    yield store
+    store.close()
+
+def vector(value: float) -> np.ndarray:
+    return np.full(DIMENSION, value, dtype=np.float32)
+
+def wal_size(store: IndexStore, generation: int) -> int:
+    return os.path.getsize(store._wal_path(generation))
+
+def test_append_and_read_back(store):
+    with store.lock():
+        cursor = store.append_many((0, 0), [(OP_ADD, 1, 7, vector(1)), (OP_ADD, 2, NO_OWNER, vector(2))])
+        cursor = store.append(cursor, OP_REMOVE, 1, NO_OWNER, vector(0))
+
+    records, end = store.read_wal((0, 0))
+    assert [(op, image_id, owner) for op, image_id, owner, _ in records] == [
+        (OP_ADD, 1, 7), (OP_ADD, 2, NO_OWNER), (OP_REMOVE, 1, NO_OWNER)
+    ]
+    assert np.array_equal(records[1][3], vector(2))
+    assert end == cursor
+
+    # A cursor only sees what was appended after it
+    with store.lock():
+        store.append(cursor, OP_ADD, 3, 7, vector(3))
+    records, _ = store.read_wal(cursor)
+    assert [image_id for _, image_id, _, _ in records] == [3]
+
+def test_torn_tail_is_ignored_and_repaired(store):
+    with store.lock():
+        cursor = store.append((0, 0), OP_ADD, 1, 7, vector(1))
+    intact = wal_size(store, 0)
+    with open(store._wal_path(0), "ab") as f:
+        f.write(b"\x01partial record")
+
+    records, end = store.read_wal((0, 0))
+    assert [image_id for _, image_id, _, _ in records] == [1]
+    assert end == cursor
+    assert wal_size(store, 0) > intact
+
+    store.read_wal((0, 0), repair=True)
+    assert wal_size(store, 0) == intact
+
+    # Appending after the repair keeps records aligned
+    with store.lock():
+        store.append(end, OP_ADD, 2, 7, vector(2))
+    records, _ = store.read_wal((0, 0))
+    assert [image_id for _, image_id, _, _ in records] == [1, 2]
+
+def test_corrupt_record_stops_replay(store):
+    with store.lock():
+        store.append_many((0, 0), [(OP_ADD, 1, 7, vector(1)), (OP_ADD, 2, 7, vector(2))])
+    record_size = (wal_size(store, 0) - WAL_HEADER.size) // 2
+    with open(store._wal_path(0), "r+b") as f:
+        f.seek(WAL_HEADER.size + record_size + 20)
+        f.write(b"\xff")
+
+    records, _ = store.read_wal((0, 0))
+    assert [image_id for _, image_id, _, _ in records] == [1]
+
+def test_checkpoint_retires_older_wals(store):
+    with store.lock():
+        store.append((0, 0), OP_ADD, 1, 7, vector(1))
+        generation = store.rotate()
+        store.append((generation, 0), OP_ADD, 2, 7, vector(2))
+
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(DIMENSION))
+    index.add_with_ids(vector(1).reshape(1, -1), np.array([1], dtype=np.int64))
+    arrays = {"ids": np.array([1], dtype=np.int64)}
+    assert store.write_checkpoint(generation, index, arrays, {"factory": "Flat"})
+
+    assert store.current_generation() == generation
+    assert not os.path.exists(store._wal_path(0))
+    loaded, loaded_arrays, meta = store.load_checkpoint(generation, mmap=True)
+    assert loaded.ntotal == 1
+    assert loaded_arrays["ids"].tolist() == [1]
+    assert meta == {"factory": "Flat"}
+    # Only the record written after the rotation is replayed on top
+    records, _ = store.read_wal((generation, 0))
+    assert [image_id for _, image_id, _, _ in records] == [2]
+
+def test_stale_checkpoint_is_not_published(store):
+    with store.lock():
+        older = store.rotate()
+        newer = store.rotate()
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(DIMENSION))
+    assert store.write_checkpoint(newer, index, {}, {})
+    assert not store.write_checkpoint(older, index, {}, {})
+    assert store.current_generation() == newer
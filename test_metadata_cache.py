@@ -0,0 +1,20 @@
+from services.metadata_cache import ImageMetadata, ImageMetadataCache
+
+def metadata(image_id: int) -> ImageMetadata:
+    return ImageMetadata(image_id, 1, f"{image_id}.jpg", f"uploads/{image_id}.jpg")
+
+def test_get_many_returns_cached_subset():
+    cache = ImageMetadataCache()
+    cache.put_many([metadata(1), metadata(2)])
+
+    assert cache.get_many([1, 2, 3]) == {1: metadata(1), 2: metadata(2)}
+    assert cache.stats() == {"entries": 2, "hits": 2, "misses": 1}
+
+def test_invalidate_and_eviction():
+    cache = ImageMetadataCache(max_entries=2)
+    cache.put_many([metadata(1), metadata(2)])
+    cache.invalidate(1)
+    assert cache.get_many([1]) == {}
+
+    cache.put_many([metadata(3), metadata(4)])
+    assert sorted(cache.get_many([2, 3, 4])) == [3, 4]
@@ -0,0 +1,21 @@
+from services.result_cache import SearchResultCache
+
+def test_entries_expire_when_index_version_changes():
+    cache = SearchResultCache()
+    key = (1, "a dog", 5, None, None)
+    cache.put(key, 3, ["result"])
+
+    assert cache.get(key, 3) == ["result"]
+    assert cache.get(key, 4) is None
+    assert cache.get((2, "a dog", 5, None, None), 3) is None
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 2}
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SearchResultCache(max_entries=2)
+    cache.put("a", 1, ["a"])
+    cache.put("b", 1, ["b"])
+    cache.get("a", 1)
+    cache.put("c", 1, ["c"])
+
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == ["a"] and cache.get("c", 1) == ["c"]
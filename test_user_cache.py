@@ -0,0 +1,63 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import User
+from auth import jwt as auth_jwt
+from auth.user_cache import UserCache
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = UserCache()
+    monkeypatch.setattr(auth_jwt, "get_user_cache", lambda: cache)
+    return cache
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'users.db'}")
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add_all([
+            User(id=1, username="alice", email="alice@example.com", hashed_password="x"),
+            User(id=2, username="bob", email="bob@example.com", hashed_password="x"),
+        ])
+        db.commit()
+        yield db
+    engine.dispose()
+
+def cache_users(cache: UserCache, db) -> dict:
+    """One token per user, cached as get_current_user would"""
+    tokens = {}
+    for user in db.query(User).order_by(User.id):
+        tokens[user.id] = f"token-{user.id}"
+        cache.put(tokens[user.id], user, time.time() + 60)
+    return tokens
+
+def test_updating_a_user_evicts_their_tokens(cache, db):
+    tokens = cache_users(cache, db)
+    alice = db.get(User, 1)
+    alice.email = "alice@example.org"
+    db.commit()
+
+    assert cache.get(tokens[1]) is None
+    assert cache.get(tokens[2]).username == "bob"
+
+def test_deleting_a_user_evicts_their_tokens(cache, db):
+    tokens = cache_users(cache, db)
+    db.delete(db.get(User, 2))
+    db.commit()
+
+    assert cache.get(tokens[2]) is None
+    assert cache.get(tokens[1]).username == "alice"
+
+def test_entries_never_outlive_the_token(cache, db):
+    user = db.get(User, 1)
+    cache.put("expiring", user, time.time() - 1)
+    cache.put("valid", user, time.time() + 60)
+
+    assert cache.get("expiring") is None
+    assert cache.get("valid") is user
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1}
@@ -1,25 +1,32 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
 from sqlalchemy.orm import Session
+from typing import List
 import logging
 
 from database import get_db
-from models import User, Image
-from schemas import ImageResponse
-from auth.jwt import get_current_user
-from services.image_service import save_uploaded_file
-from services.search_service import add_image_to_search_index
+from models import Image
+from schemas import ImageResponse, BulkUploadResponse
+from auth.jwt import get_current_user_id
+from services.image_service import hash_content, find_duplicate, save_uploaded_file
+from services.ingestion import get_ingestion_pipeline
+from services.bulk_ingest import BulkIngestor, iter_archive, is_archive_name
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api", tags=["upload"])
 
+ARCHIVE_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed", "application/x-tar", "application/gzip"}
+
 @router.post("/upload", response_model=ImageResponse, status_code=status.HTTP_201_CREATED)
-async def upload_image(
+def upload_image(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
+    current_user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    """Upload an image file"""
+    """
+    Upload an image file. Embedding, classification and indexing run in the
+    background; poll /api/images/{id}/status until it is indexed.
+    """
     try:
         # Validate file type
         if not file.content_type or not file.content_type.startswith('image/'):
@@ -28,27 +35,31 @@ async def upload_image(
                 detail="File must be an image"
             )
         
-        # Read file content
-        file_content = await file.read()
+        # Read file content (sync route, so this runs in the threadpool, not the event loop)
+        file_content = file.file.read()
+        content_hash = hash_content(file_content)
+        
+        # Identical bytes were uploaded before: share their file and classification
+        duplicate = find_duplicate(content_hash, db)
         
         # Save file
-        filepath = save_uploaded_file(file_content, file.filename, current_user.id)
+        filepath = duplicate.filepath if duplicate else save_uploaded_file(file_content, file.filename, content_hash)
         
         # Create database record
         new_image = Image(
             filename=file.filename,
             filepath=filepath,
-            user_id=current_user.id
+            user_id=current_user_id,
+            content_hash=content_hash,
+            classification=duplicate.classification if duplicate else None,
+            confidence=duplicate.confidence if duplicate else None
         )
         db.add(new_image)
         db.commit()
         db.refresh(new_image)
         
-        # Add to search index (async in background if needed)
-        try:
-            add_image_to_search_index(new_image.id, filepath, db)
-        except Exception as e:
-            logger.warning(f"Failed to add image to search index: {e}")
+        # Embed and index in the background; the pipeline reuses a duplicate's embedding
+        get_ingestion_pipeline().enqueue(new_image.id)
         
         return new_image
     except HTTPException:
@@ -59,3 +70,39 @@ async def upload_image(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error uploading image: {str(e)}"
         )
+
+@router.post("/upload/bulk", response_model=BulkUploadResponse, status_code=status.HTTP_201_CREATED)
+def bulk_upload_images(
+    files: List[UploadFile] = File(...),
+    current_user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    Upload many images at once, as image files and/or zip/tar archives.
+    Images are embedded and indexed in batches before the response returns.
+    """
+    try:
+        ingestor = BulkIngestor(current_user_id, db)
+        
+        def iter_files():
+            for file in files:
+                filename = file.filename or ""
+                if is_archive_name(filename) or file.content_type in ARCHIVE_CONTENT_TYPES:
+                    try:
+                        yield from iter_archive(file.file, filename)
+                    except Exception as e:
+                        ingestor.reject(filename, f"Could not read archive: {e}")
+                elif file.content_type and file.content_type.startswith('image/'):
+                    yield filename, file.file.read()
+                else:
+                    ingestor.reject(filename, "File must be an image or an archive")
+        
+        return BulkUploadResponse(**ingestor.ingest(iter_files()))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error bulk uploading images: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error bulk uploading images: {str(e)}"
+        )
@@ -0,0 +1,68 @@
+from collections import OrderedDict
+import os
+import threading
+import time
+
+# Seconds a verified token's user is reused without a lookup; never past the token's own expiry
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+class UserCache:
+    """
+    LRU cache of verified token -> User, so authenticated requests skip both
+    JWT verification and the user query. An entry expires after the TTL or
+    when its token does, whichever is first, and is dropped when the user
+    is updated or deleted in this process.
+    """
+
+    def __init__(self, ttl: float = USER_CACHE_TTL, max_entries: int = USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # token -> (user, expires_at)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, token: str):
+        """Cached user for `token`, or None"""
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self.entries[token]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, user, token_expires_at: float):
+        """Cache `user` for a token verified to expire at `token_expires_at` (epoch seconds)"""
+        expires_at = min(time.time() + self.ttl, token_expires_at)
+        with self.lock:
+            self.entries[token] = (user, expires_at)
+            self.entries.move_to_end(token)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        """Forget every token of a user"""
+        with self.lock:
+            for token in [token for token, (user, _) in self.entries.items() if user.id == user_id]:
+                del self.entries[token]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+# Global user cache instance
+user_cache = None
+user_cache_lock = threading.Lock()
+
+def get_user_cache():
+    global user_cache
+    if user_cache is None:
+        with user_cache_lock:
+            if user_cache is None:
+                user_cache = UserCache()
+    return user_cache